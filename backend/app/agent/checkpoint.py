@@ -0,0 +1,116 @@
+import queue
+import sqlite3
+import threading
+from typing import Optional
+
+import msgpack
+import zstandard
+
+
+class SqliteStateStore:
+    """
+    Compact on-disk persistence for final agent states.
+
+    States are serialized with msgpack and compressed with zstd, then
+    stored in SQLite (WAL mode) keyed by thread_id. Writes go through a
+    dedicated writer thread behind a queue so the event loop never blocks
+    on disk I/O; reads are synchronous but rare (one per resumed thread).
+
+    The same database also holds cold design-history entries evicted from
+    the in-memory window, keyed by (conversation_id, version).
+    """
+
+    def __init__(self, path: str = "agent_state.db"):
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS states ("
+            "thread_id TEXT PRIMARY KEY, "
+            "blob BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS design_history ("
+            "conversation_id TEXT NOT NULL, "
+            "version INTEGER NOT NULL, "
+            "blob BLOB NOT NULL, "
+            "PRIMARY KEY (conversation_id, version))"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._drain, name="state-store-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _drain(self):
+        """Writer loop: flush queued writes to SQLite off the event loop."""
+        while True:
+            sql, params = self._queue.get()
+            try:
+                with self._lock:
+                    self._conn.execute(sql, params)
+                    self._conn.commit()
+            finally:
+                self._queue.task_done()
+
+    def put(self, thread_id: str, state: dict) -> None:
+        """Queue a state for persistence (returns immediately)."""
+        blob = self._compressor.compress(
+            msgpack.packb(state, use_bin_type=True, default=str)
+        )
+        self._queue.put((
+            "INSERT INTO states (thread_id, blob) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET blob = excluded.blob",
+            (thread_id, blob)
+        ))
+
+    def get(self, thread_id: str) -> Optional[dict]:
+        """Load the last persisted state for a thread, if any."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob FROM states WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return msgpack.unpackb(
+            self._decompressor.decompress(row[0]), raw=False
+        )
+
+    def put_history_entry(self, conversation_id: str, version: int, entry: dict) -> None:
+        """Queue a cold design-history entry for persistence."""
+        blob = msgpack.packb(entry, use_bin_type=True, default=str)
+        self._queue.put((
+            "INSERT INTO design_history (conversation_id, version, blob) "
+            "VALUES (?, ?, ?) "
+            "ON CONFLICT(conversation_id, version) DO UPDATE SET blob = excluded.blob",
+            (conversation_id, version, blob)
+        ))
+
+    def get_history_entry(self, conversation_id: str, version: int) -> Optional[dict]:
+        """Load a cold design-history entry, if it was spilled to disk."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT blob FROM design_history "
+                "WHERE conversation_id = ? AND version = ?",
+                (conversation_id, version)
+            ).fetchone()
+        if row is None:
+            return None
+        return msgpack.unpackb(row[0], raw=False)
+
+
+_store_lock = threading.Lock()
+_store: Optional[SqliteStateStore] = None
+
+
+def get_state_store() -> SqliteStateStore:
+    """Get the process-wide state store instance."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SqliteStateStore()
+    return _store
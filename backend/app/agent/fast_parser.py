@@ -0,0 +1,137 @@
+"""
+Deterministic fast-path parser for simple chat turns.
+
+Messages like "cambia el color a rojo" or "5 metros" are fully parseable
+with rules, so paying a ~1s LLM round-trip for them is wasted latency.
+classify() returns an analysis dict shaped like
+GeminiReasoner.analyze_request plus a confidence score; the agent skips
+the LLM when confidence is at or above CONFIDENCE_THRESHOLD.
+"""
+import re
+from typing import Tuple
+
+# Confidence at or above which the LLM analysis is skipped
+CONFIDENCE_THRESHOLD = 0.9
+
+_METERS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:metros?|mts?)\b")
+
+_SHAPE_PATTERNS = (
+    (re.compile(r"\ben\s*ele\b|\ben\s*l\b|\bforma\s*(?:de\s*)?l\b"), "L"),
+    (re.compile(r"\ben\s*u\b|\bforma\s*(?:de\s*)?u\b"), "U"),
+    (re.compile(r"\ben\s*g\b|\bforma\s*(?:de\s*)?g\b|\bpen[ií]nsula\b"), "G"),
+    (re.compile(r"\blineal\b|\buna\s*pared\b"), "I"),
+    (re.compile(r"\bparalela?\b|\bpasillo\b|\bgalera\b"), "parallel"),
+)
+
+_STYLE_WORDS = {
+    "moderno": "modern", "moderna": "modern",
+    "clásico": "classic", "clásica": "classic",
+    "clasico": "classic", "clasica": "classic",
+    "rústico": "rustic", "rústica": "rustic",
+    "rustico": "rustic", "rustica": "rustic",
+    "minimalista": "minimalist",
+    "industrial": "industrial",
+    "escandinavo": "scandinavian", "escandinava": "scandinavian",
+    "contemporáneo": "contemporary", "contemporánea": "contemporary",
+    "contemporaneo": "contemporary", "contemporanea": "contemporary",
+}
+
+_COLOR_WORDS = {
+    "blanco": "white", "blanca": "white",
+    "negro": "black", "negra": "black",
+    "gris": "gray",
+    "rojo": "red", "roja": "red",
+    "azul": "blue",
+    "verde": "green",
+    "amarillo": "yellow", "amarilla": "yellow",
+    "beige": "beige",
+    "café": "brown", "cafe": "brown",
+    "madera": "wood tones",
+}
+
+# Whole-word alternations (plus optional plural) so "azul" can't fire
+# inside "azulejo" and invent colors the user never asked for
+_STYLE_RE = re.compile(r"\b(" + "|".join(_STYLE_WORDS) + r")(?:e?s)?\b")
+_COLOR_RE = re.compile(r"\b(" + "|".join(_COLOR_WORDS) + r")(?:e?s)?\b")
+
+_EDIT_INTENT_RE = re.compile(
+    r"\b(cambia|cambiar|modifica|modificar|ajusta|ajustar|agrega|agregar|"
+    r"añade|anade|quita|quitar|pon|ponle|hazlo|hazla)\b"
+)
+_GENERATE_INTENT_RE = re.compile(
+    r"\b(genera|generar|diseña|disena|diseñar|crea|crear|hazme)\b"
+)
+
+_EMPTY_MATERIALS = {"cabinets": None, "countertop": None, "backsplash": None}
+
+
+def classify(message: str) -> Tuple[dict, float]:
+    """
+    Classify a message with deterministic rules.
+
+    Returns (analysis, confidence) where analysis matches the shape of
+    GeminiReasoner.analyze_request output. Confidence is high only for
+    short messages fully covered by the recognized signals.
+    """
+    text = message.strip().lower()
+
+    analysis = {
+        "action": "question",
+        "linear_meters": None,
+        "shape": None,
+        "style": None,
+        "materials": dict(_EMPTY_MATERIALS),
+        "colors": None,
+        "budget": None,
+        "edit_instructions": None,
+        "questions_to_ask": None,
+        "special_requirements": None,
+    }
+
+    signals = 0
+
+    meters_match = _METERS_RE.search(text)
+    if meters_match:
+        analysis["linear_meters"] = float(meters_match.group(1))
+        signals += 1
+
+    for pattern, shape in _SHAPE_PATTERNS:
+        if pattern.search(text):
+            analysis["shape"] = shape
+            signals += 1
+            break
+
+    style_match = _STYLE_RE.search(text)
+    if style_match:
+        analysis["style"] = _STYLE_WORDS[style_match.group(1)]
+        signals += 1
+
+    colors = [_COLOR_WORDS[word] for word in _COLOR_RE.findall(text)]
+    if colors:
+        analysis["colors"] = list(dict.fromkeys(colors))
+        signals += 1
+
+    is_edit = bool(_EDIT_INTENT_RE.search(text))
+    is_generate = bool(_GENERATE_INTENT_RE.search(text))
+
+    if is_edit:
+        analysis["action"] = "edit"
+        analysis["edit_instructions"] = message.strip()
+    elif is_generate or signals:
+        # Bare parameters ("5 metros", "en L estilo moderno") are treated
+        # as (re)generation input; the agent still asks for missing meters
+        analysis["action"] = "generate"
+
+    # High confidence only for short messages without open questions where
+    # the rules actually recognized something
+    word_count = len(text.split())
+    if "?" in text or "¿" in text:
+        confidence = 0.0
+    elif is_edit and (signals or word_count <= 6):
+        confidence = 0.95
+    elif signals and word_count <= 6 and not is_generate:
+        confidence = 0.95
+    else:
+        confidence = min(0.5, 0.2 * signals)
+
+    return analysis, confidence
@@ -1,49 +1,288 @@
-from typing import TypedDict, Annotated, List, Optional, Dict, Any
-from uuid import UUID
-import json
+from typing import Annotated, List, Optional, Dict
+import asyncio
+import base64
+import dataclasses
+import enum
+import functools
+import hashlib
 import operator
+import re
+from collections import OrderedDict
+
+import orjson
 
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
-from app.agent.prompts import SYSTEM_PROMPT, SPECS_TEMPLATE
+try:
+    from langgraph.config import get_stream_writer
+except ImportError:  # older langgraph without custom stream support
+    get_stream_writer = None
+
+from app.agent import fast_parser
+from app.agent.checkpoint import get_state_store
 from app.agent.tools import (
-    GeminiReasoner, 
-    GeminiImageGenerator,
+    get_reasoner,
+    get_image_generator,
+    get_analysis_batcher,
     generate_kitchen_image,
     edit_kitchen_image
 )
 
 
-class KitchenState(TypedDict):
-    """State for the kitchen design agent."""
-    messages: Annotated[List[dict], operator.add]
-    user_id: str
-    conversation_id: str
-    
+# Quick heuristic for messages that clearly ask for a new design, used to
+# launch image generation speculatively while the LLM analysis runs
+_GENERATE_HINT_RE = re.compile(
+    r"\b(genera|diseña|disena|crea|hazme)\b.*\bcocina\b|\bcocina\b.*\b\d+(\.\d+)?\s*metros\b",
+    re.IGNORECASE
+)
+_METERS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*metros")
+
+# Display names and cost ranges are constants; build them once at import
+# instead of reallocating the dicts inside the hot generation path
+SHAPE_NAMES = {
+    "I": "lineal",
+    "L": "en L",
+    "U": "en U",
+    "G": "en G",
+    "parallel": "paralela"
+}
+
+COST_RANGES = {
+    "low": "$15,000 - $25,000 MXN",
+    "medium": "$25,000 - $45,000 MXN",
+    "high": "$45,000 - $80,000 MXN",
+    "premium": "$80,000 - $150,000+ MXN"
+}
+
+# Max entries kept in the conversational response cache
+_RESPONSE_CACHE_SIZE = 512
+
+# Max generated images kept for parameter-identical regeneration requests
+_IMAGE_CACHE_SIZE = 64
+
+# Design-history entries kept in graph state; older entries spill to the
+# state store so state size stays bounded regardless of turn count
+_DESIGN_HISTORY_SIZE = 8
+
+
+class Action(enum.IntEnum):
+    """Routing decisions, valued so they index _ROUTES directly."""
+    CLARIFY = 0
+    GENERATE = 1
+    EDIT = 2
+    RESPOND = 3
+
+
+# Node names in Action-value order; routing is a single tuple index
+_ROUTES = ("clarify", "generate", "edit", "respond")
+
+# Action strings produced by the LLM analysis and the fast parser
+_ACTION_BY_NAME = {
+    "clarification": Action.CLARIFY,
+    "generate": Action.GENERATE,
+    "edit": Action.EDIT,
+    "question": Action.RESPOND,
+    "respond": Action.RESPOND
+}
+
+# State keys exposed to external callers (API layer / Redis)
+_EXTERNAL_STATE_KEYS = (
+    "linear_meters", "shape", "style", "materials", "colors", "budget",
+    "current_image", "design_version", "design_history", "messages"
+)
+
+# Response templates, pre-built at import so the hot nodes only format them
+SHAPE_SUGGESTIONS = (
+    "\n\n**Configuraciones disponibles:**\n"
+    "- **Lineal (I):** Ideal para espacios estrechos\n"
+    "- **En L:** La más versátil, aprovecha esquinas\n"
+    "- **En U:** Máximo almacenamiento, espacios amplios\n"
+    "- **Paralela:** Perfecta para cocinas tipo pasillo\n"
+)
+
+DESIGN_RESPONSE_TEMPLATE = """## Diseño de Cocina - Versión {version}
+
+He creado un diseño de cocina **{style}** con configuración **{shape_name}** de **{linear_meters} metros lineales**.
+
+### Características principales:
+- **Gabinetes:** {cabinets}
+- **Cubierta:** {countertop}
+- **Salpicadero:** {backsplash}
+- **Paleta de colores:** {colors}
+
+¿Te gustaría hacer alguna modificación? Puedo ajustar colores, materiales, agregar o quitar elementos, cambiar el estilo, etc."""
+
+EDIT_RESPONSE_TEMPLATE = """## Diseño Actualizado - Versión {version}
+
+He aplicado las modificaciones solicitadas al diseño. 
+
+¿Qué te parece? Puedo seguir ajustando cualquier detalle que necesites."""
+
+
+class KitchenImage:
+    """
+    Image payload kept as raw bytes with a lazily memoized base64 form.
+
+    Base64 is ~33% larger than the raw PNG, so raw bytes are the canonical
+    in-memory form; the encoded string is computed on first boundary use
+    (edit API, frontend artifacts) and reused for the image's lifetime.
+    """
+
+    __slots__ = ("data", "_base64")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._base64: Optional[str] = None
+
+    @classmethod
+    def from_base64(cls, encoded: str) -> "KitchenImage":
+        """Build from an already-encoded payload (API or external state)."""
+        return cls(base64.b64decode(encoded))
+
+    @property
+    def base64(self) -> str:
+        """Base64-encoded payload, computed once on first access."""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode()
+        return self._base64
+
+
+@dataclasses.dataclass(slots=True)
+class KitchenState:
+    """
+    State for the kitchen design agent.
+
+    A slotted dataclass instead of a TypedDict: slots store the 19 fields
+    in a flat array rather than a per-snapshot dict, which matters when
+    long sessions keep many state copies alive at once.
+    """
+    user_id: str = ""
+    conversation_id: str = ""
+    messages: Annotated[List[dict], operator.add] = dataclasses.field(default_factory=list)
+
     # Design parameters
-    linear_meters: Optional[float]
-    shape: Optional[str]
-    style: Optional[str]
-    materials: Optional[Dict[str, str]]
-    colors: Optional[List[str]]
-    budget: Optional[str]
-    
+    linear_meters: Optional[float] = None
+    shape: Optional[str] = None
+    style: Optional[str] = None
+    materials: Dict[str, str] = dataclasses.field(default_factory=dict)
+    colors: List[str] = dataclasses.field(default_factory=list)
+    budget: Optional[str] = None
+
     # Current design state
-    current_image: Optional[str]  # base64
-    design_version: int
-    design_history: List[dict]
-    
+    current_image: Optional[str] = None  # reference key into the agent's image store
+    design_version: int = 0
+    design_history: List[dict] = dataclasses.field(default_factory=list)
+
     # Agent state
-    action: Optional[str]
-    needs_clarification: bool
-    questions: List[str]
-    
+    action: Optional[int] = None  # Action value; _route_action indexes _ROUTES
+    needs_clarification: bool = False
+    questions: List[str] = dataclasses.field(default_factory=list)
+
     # Response
-    response_text: str
-    artifacts: List[dict]
-    error: Optional[str]
+    response_text: str = ""
+    artifacts: List[dict] = dataclasses.field(default_factory=list)
+    error: Optional[str] = None
+
+    # Internal: pre-fetched image result from speculative generation
+    _speculative_image: Optional[dict] = None
+
+    def to_dict(self) -> dict:
+        """Shallow dict view for the LangGraph boundary and persistence."""
+        return {name: getattr(self, name) for name in _STATE_FIELD_NAMES}
+
+
+_STATE_FIELD_NAMES = tuple(f.name for f in dataclasses.fields(KitchenState))
+
+
+def _state_from_dict(raw: dict) -> KitchenState:
+    """Rehydrate a state instance from an external or persisted dict."""
+    return KitchenState(
+        **{name: raw[name] for name in _STATE_FIELD_NAMES if name in raw}
+    )
+
+
+def _as_state_dict(state) -> dict:
+    """Normalize a graph state (dataclass or mapping) to a plain dict."""
+    if isinstance(state, KitchenState):
+        return state.to_dict()
+    return dict(state)
+
+
+@functools.lru_cache(maxsize=256)
+def _generate_specs(
+    linear_meters: float,
+    shape: str,
+    style: str,
+    materials_items: frozenset
+) -> str:
+    """
+    Generate technical specifications.
+
+    Pure function of its arguments, so results are memoized; materials are
+    passed as frozenset(materials.items()) to keep the key hashable.
+    """
+    materials = dict(materials_items)
+
+    # Module distribution as closed-form arithmetic: standard modules are
+    # claimed via bool multiplication (True == 1), storage fills the rest
+    has_sink = linear_meters >= 0.9
+    remaining = linear_meters - 0.9 * has_sink
+    has_stove = remaining >= 0.6
+    remaining -= 0.6 * has_stove
+    has_fridge = remaining >= 0.6
+    remaining -= 0.6 * has_fridge
+    storage_60 = int(remaining / 0.6)
+    storage_40 = int((remaining - storage_60 * 0.6) / 0.4)
+
+    modules = []
+    if has_sink:
+        modules.append("1x Módulo fregadero (90cm)")
+    if has_stove:
+        modules.append("1x Módulo estufa/parrilla (60cm)")
+    if has_fridge:
+        modules.append("1x Módulo refrigerador (60cm)")
+    if storage_60 > 0:
+        modules.append(f"{storage_60}x Módulo almacenamiento (60cm)")
+    if storage_40 > 0:
+        modules.append(f"{storage_40}x Módulo almacenamiento (40cm)")
+
+    module_distribution = "\n".join(f"- {m}" for m in modules)
+    
+    # Appliances
+    appliances = """- Campana extractora
+- Estufa/Parrilla 4 quemadores
+- Horno empotrable (opcional)
+- Refrigerador
+- Microondas empotrable (opcional)
+- Lavavajillas (opcional)"""
+    
+    specs = f"""## Especificaciones Técnicas
+
+### Dimensiones
+- **Metros lineales:** {linear_meters}m
+- **Configuración:** {shape}
+- **Altura muebles bajos:** 85 cm
+- **Altura muebles altos:** 80 cm
+- **Profundidad muebles bajos:** 60 cm
+
+### Materiales
+- **Gabinetes:** {materials.get('cabinets', 'MDF lacado')}
+- **Cubierta:** {materials.get('countertop', 'Cuarzo')}
+- **Salpicadero:** {materials.get('backsplash', 'Azulejo')}
+- **Herrajes:** Cierre suave, bisagras de 110°
+
+### Distribución de Módulos
+{module_distribution}
+
+### Electrodomésticos Sugeridos
+{appliances}
+
+### Estimación de Inversión
+Rango aproximado: {COST_RANGES.get('medium', '$30,000 - $50,000 MXN')}
+
+*Nota: Los precios son aproximados y pueden variar según proveedor y ubicación.*"""
+    
+    return specs
 
 
 class KitchenDesignAgent:
@@ -57,11 +296,81 @@ class KitchenDesignAgent:
     4. Format response with artifacts
     """
     
-    def __init__(self):
-        self.reasoner = GeminiReasoner(SYSTEM_PROMPT)
-        self.image_generator = GeminiImageGenerator()
-        self.memory = MemorySaver()
-        self.graph = self._build_graph()
+    def __init__(self, checkpoint_mode: str = "end_of_workflow"):
+        self.reasoner = get_reasoner()
+        self.image_generator = get_image_generator()
+        self.checkpoint_mode = checkpoint_mode
+        # Per-node checkpointing copies the full state after each node, but
+        # only the terminal state has recovery value here. By default we
+        # compile without a checkpointer and persist just the final state
+        # per thread; "per_node" restores the old behavior.
+        if checkpoint_mode == "per_node":
+            from langgraph.checkpoint.memory import MemorySaver
+            self.memory = MemorySaver()
+        else:
+            self.memory = None
+        # Graph compilation is deferred to first use so constructing the
+        # agent (e.g. at worker boot) stays cheap
+        self._graph = None
+        # Final states are persisted msgpack+zstd-compressed in SQLite
+        # instead of an ever-growing dict of Python dicts in RAM
+        self._state_store = get_state_store()
+        # Image payloads live outside the graph state so checkpoint/state
+        # copies don't drag megabytes of base64 through every superstep.
+        # Keyed by conversation_id, holding only the latest (version, image).
+        self._image_store: Dict[str, tuple] = {}
+        # LRU cache of conversational replies; repeated chit-chat turns
+        # ("hola", "gracias") skip the LLM round-trip entirely
+        self._response_cache: OrderedDict = OrderedDict()
+        # LRU cache of generated images keyed by a digest of the full
+        # parameter set; undo/redo flows replay a design without paying
+        # the image model again
+        self._image_cache: OrderedDict = OrderedDict()
+
+    @property
+    def graph(self):
+        """Compiled workflow, built lazily on first request."""
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+
+    @staticmethod
+    def _stream_writer():
+        """Return the active custom stream writer, or None outside astream."""
+        if get_stream_writer is None:
+            return None
+        try:
+            return get_stream_writer()
+        except Exception:
+            return None
+
+    def _response_cache_key(self, user_message: str, state: KitchenState) -> tuple:
+        """Cache key from the message plus a small state fingerprint."""
+        digest = hashlib.blake2b(
+            user_message.lower().strip().encode(), digest_size=8
+        ).hexdigest()
+        return (
+            digest,
+            state.shape,
+            state.style,
+            state.design_version > 0
+        )
+
+    def _put_image(self, conversation_id: str, version: int, image_base64: str) -> str:
+        """Store an image payload and return the reference key kept in state."""
+        image = KitchenImage.from_base64(image_base64)
+        self._image_store[conversation_id] = (version, image)
+        return f"{conversation_id}:{version}"
+
+    def _get_image(self, ref: Optional[str]) -> Optional[KitchenImage]:
+        """Resolve a current_image reference to its stored payload."""
+        if not ref:
+            return None
+        conversation_id, _, version = ref.rpartition(":")
+        entry = self._image_store.get(conversation_id)
+        if entry and str(entry[0]) == version:
+            return entry[1]
+        return None
     
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph workflow."""
@@ -74,11 +383,10 @@ class KitchenDesignAgent:
         workflow.add_node("generate", self._generate_design)
         workflow.add_node("edit", self._edit_design)
         workflow.add_node("respond", self._generate_response)
-        workflow.add_node("format_output", self._format_output)
-        
+
         # Set entry point
         workflow.set_entry_point("analyze")
-        
+
         # Add conditional edges
         workflow.add_conditional_edges(
             "analyze",
@@ -90,58 +398,80 @@ class KitchenDesignAgent:
                 "respond": "respond"
             }
         )
-        
-        # All paths lead to format_output
-        workflow.add_edge("clarify", "format_output")
-        workflow.add_edge("generate", "format_output")
-        workflow.add_edge("edit", "format_output")
-        workflow.add_edge("respond", "format_output")
-        workflow.add_edge("format_output", END)
-        
-        return workflow.compile(checkpointer=self.memory)
+
+        # Action nodes already leave response_text/artifacts in state, so
+        # each path ends the graph directly; output shaping happens in
+        # _finalize without paying another superstep
+        workflow.add_edge("clarify", END)
+        workflow.add_edge("generate", END)
+        workflow.add_edge("edit", END)
+        workflow.add_edge("respond", END)
+        
+        if self.memory is not None:
+            return workflow.compile(checkpointer=self.memory)
+        return workflow.compile()
     
     def _route_action(self, state: KitchenState) -> str:
-        """Route to appropriate action based on analysis."""
-        if state.get("needs_clarification"):
+        """Route to the node named by the precomputed Action value."""
+        if state.needs_clarification:
             return "clarify"
-        
-        action = state.get("action", "respond")
-        
-        if action == "generate":
-            return "generate"
-        elif action == "edit":
-            return "edit"
-        else:
-            return "respond"
+        return _ROUTES[Action.RESPOND if state.action is None else state.action]
     
     async def _analyze_input(self, state: KitchenState) -> dict:
         """Analyze user input to determine intent and extract parameters."""
         
         # Get the last user message
-        messages = state.get("messages", [])
+        messages = state.messages
         if not messages:
             return {"error": "No message provided"}
-        
+
         last_message = messages[-1]
         user_message = last_message.get("content", "")
-        
+
         # Build context from current state
         context = {
-            "linear_meters": state.get("linear_meters"),
-            "shape": state.get("shape"),
-            "style": state.get("style"),
-            "materials": state.get("materials"),
-            "has_current_design": state.get("current_image") is not None,
-            "design_version": state.get("design_version", 0)
+            "linear_meters": state.linear_meters,
+            "shape": state.shape,
+            "style": state.style,
+            "materials": state.materials,
+            "has_current_design": state.current_image is not None,
+            "design_version": state.design_version
         }
         
-        # Analyze with Gemini
-        analysis = await self.reasoner.analyze_request(user_message, context)
-        
-        # Update state based on analysis
+        # Deterministic fast path: simple parameter updates and edit
+        # commands are parsed locally, skipping the LLM round-trip
+        fast_analysis, confidence = fast_parser.classify(user_message)
+
+        speculative_task = None
+        speculative_params = None
+
+        if confidence >= fast_parser.CONFIDENCE_THRESHOLD:
+            analysis = fast_analysis
+        else:
+            # If the message clearly asks for a new design, start generating
+            # the image speculatively so it overlaps the analysis round-trip
+            if _GENERATE_HINT_RE.search(user_message):
+                speculative_params = self._speculative_params(state, user_message)
+                if speculative_params:
+                    speculative_task = asyncio.create_task(
+                        generate_kitchen_image(**speculative_params)
+                    )
+
+            # Analyze with Gemini; the batcher coalesces analyses from
+            # concurrent turns into a single LLM call when load allows
+            try:
+                analysis = await get_analysis_batcher().analyze(user_message, context)
+            except Exception:
+                if speculative_task:
+                    speculative_task.cancel()
+                raise
+
+        # Update state based on analysis; the action string is mapped to
+        # its Action value once so routing is a plain tuple index
+        action = _ACTION_BY_NAME.get(analysis.get("action"), Action.RESPOND)
         updates = {
-            "action": analysis.get("action", "respond"),
-            "needs_clarification": analysis.get("action") == "clarification",
+            "action": action,
+            "needs_clarification": action is Action.CLARIFY,
             "questions": analysis.get("questions_to_ask", [])
         }
         
@@ -153,7 +483,7 @@ class KitchenDesignAgent:
         if analysis.get("style"):
             updates["style"] = analysis["style"]
         if analysis.get("materials"):
-            current_materials = state.get("materials", {})
+            current_materials = state.materials or {}
             current_materials.update({k: v for k, v in analysis["materials"].items() if v})
             updates["materials"] = current_materials
         if analysis.get("colors"):
@@ -162,26 +492,84 @@ class KitchenDesignAgent:
             updates["budget"] = analysis["budget"]
         
         # Check if we have enough info to generate
-        if updates["action"] == "generate":
-            if not updates.get("linear_meters") and not state.get("linear_meters"):
+        if action is Action.GENERATE:
+            if not updates.get("linear_meters") and not state.linear_meters:
                 updates["needs_clarification"] = True
                 updates["questions"] = ["¿Cuántos metros lineales tiene disponibles para su cocina?"]
-        
+
+        # Reconcile the speculative generation with the analysis result:
+        # keep the pre-fetched image only if the analysis confirmed "generate"
+        # and didn't materially change the parameters we guessed
+        updates["_speculative_image"] = None
+        if speculative_task:
+            if (
+                action is Action.GENERATE
+                and not updates.get("needs_clarification")
+                and self._speculation_matches(speculative_params, updates, state)
+            ):
+                result = await speculative_task
+                if result.get("success"):
+                    updates["_speculative_image"] = {
+                        "result": result,
+                        "params": speculative_params
+                    }
+            else:
+                speculative_task.cancel()
+
         return updates
+
+    def _speculative_params(self, state: KitchenState, user_message: str) -> Optional[dict]:
+        """Build generation params from state/message for speculative calls."""
+        meters_match = _METERS_RE.search(user_message.lower())
+        linear_meters = (
+            float(meters_match.group(1)) if meters_match
+            else state.linear_meters
+        )
+        if not linear_meters:
+            return None
+
+        return {
+            "linear_meters": linear_meters,
+            "shape": state.shape or "L",
+            "style": state.style or "modern",
+            "materials": state.materials or {
+                "cabinets": "lacquered MDF",
+                "countertop": "quartz",
+                "backsplash": "ceramic tiles"
+            },
+            "colors": state.colors or ["white", "gray"]
+        }
+
+    def _speculation_matches(
+        self,
+        params: dict,
+        updates: dict,
+        state: KitchenState
+    ) -> bool:
+        """Check the analysis didn't override the speculatively used params."""
+        for key in ("linear_meters", "shape", "style"):
+            resolved = updates.get(key) or getattr(state, key)
+            if resolved is not None and resolved != params[key]:
+                return False
+        if updates.get("materials") and updates["materials"] != params["materials"]:
+            return False
+        if updates.get("colors") and updates["colors"] != params["colors"]:
+            return False
+        return True
     
     async def _ask_clarification(self, state: KitchenState) -> dict:
         """Generate clarification questions."""
         
-        questions = state.get("questions", [])
-        
+        questions = state.questions
+
         if not questions:
             # Generate contextual questions
             missing = []
-            if not state.get("linear_meters"):
+            if not state.linear_meters:
                 missing.append("metros lineales disponibles")
-            if not state.get("shape"):
+            if not state.shape:
                 missing.append("configuración deseada (L, U, lineal, etc.)")
-            if not state.get("style"):
+            if not state.style:
                 missing.append("estilo preferido")
             
             if missing:
@@ -189,44 +577,58 @@ class KitchenDesignAgent:
             else:
                 questions = ["¿Podrías darme más detalles sobre lo que te gustaría modificar?"]
         
-        # Format response
-        response_text = "\n".join(questions)
+        # Format response: collect fragments and join once
+        parts = ["\n".join(questions)]
         
         # Add helpful suggestions
-        if not state.get("shape"):
-            response_text += "\n\n**Configuraciones disponibles:**\n"
-            response_text += "- **Lineal (I):** Ideal para espacios estrechos\n"
-            response_text += "- **En L:** La más versátil, aprovecha esquinas\n"
-            response_text += "- **En U:** Máximo almacenamiento, espacios amplios\n"
-            response_text += "- **Paralela:** Perfecta para cocinas tipo pasillo\n"
+        if not state.shape:
+            parts.append(SHAPE_SUGGESTIONS)
         
         return {
-            "response_text": response_text,
+            "response_text": "".join(parts),
             "artifacts": []
         }
     
     async def _generate_design(self, state: KitchenState) -> dict:
         """Generate a new kitchen design."""
-        
-        linear_meters = state.get("linear_meters", 3.0)
-        shape = state.get("shape", "L")
-        style = state.get("style", "modern")
-        materials = state.get("materials", {
+
+        writer = self._stream_writer()
+        if writer:
+            writer({"type": "status", "content": "Generando diseño..."})
+
+        linear_meters = state.linear_meters or 3.0
+        shape = state.shape or "L"
+        style = state.style or "modern"
+        materials = state.materials or {
             "cabinets": "lacquered MDF",
             "countertop": "quartz",
             "backsplash": "ceramic tiles"
-        })
-        colors = state.get("colors", ["white", "gray"])
-        
-        # Generate image
-        result = await generate_kitchen_image(
-            linear_meters=linear_meters,
-            shape=shape,
-            style=style,
-            materials=materials,
-            colors=colors
-        )
-        
+        }
+        colors = state.colors or ["white", "gray"]
+
+        params = {
+            "linear_meters": linear_meters,
+            "shape": shape,
+            "style": style,
+            "materials": materials,
+            "colors": colors
+        }
+        cache_key = hashlib.blake2b(
+            orjson.dumps(params, option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).digest()
+
+        # Use the speculatively pre-fetched image if its params still match,
+        # then a cached image for parameter-identical requests (undo/redo),
+        # and only then pay for a fresh generation
+        speculative = state._speculative_image
+        if speculative and speculative["params"] == params:
+            result = speculative["result"]
+        elif cache_key in self._image_cache:
+            self._image_cache.move_to_end(cache_key)
+            result = self._image_cache[cache_key]
+        else:
+            result = await generate_kitchen_image(**params)
+
         if not result.get("success"):
             return {
                 "response_text": f"Lo siento, hubo un problema al generar la imagen: {result.get('error', 'Error desconocido')}. ¿Podrías intentarlo de nuevo?",
@@ -243,32 +645,30 @@ class KitchenDesignAgent:
                 "error": "No images generated"
             }
         
+        if cache_key not in self._image_cache:
+            self._image_cache[cache_key] = result
+            if len(self._image_cache) > _IMAGE_CACHE_SIZE:
+                self._image_cache.popitem(last=False)
+
         image_base64 = images[0]
-        new_version = state.get("design_version", 0) + 1
-        
+        new_version = state.design_version + 1
+
         # Generate specifications
-        specs = self._generate_specs(linear_meters, shape, style, materials)
+        specs = _generate_specs(
+            linear_meters, shape, style, frozenset(materials.items())
+        )
         
         # Build response
-        shape_names = {
-            "I": "lineal",
-            "L": "en L",
-            "U": "en U",
-            "G": "en G",
-            "parallel": "paralela"
-        }
-        
-        response_text = f"""## Diseño de Cocina - Versión {new_version}
-
-He creado un diseño de cocina **{style}** con configuración **{shape_names.get(shape, shape)}** de **{linear_meters} metros lineales**.
-
-### Características principales:
-- **Gabinetes:** {materials.get('cabinets', 'MDF lacado')}
-- **Cubierta:** {materials.get('countertop', 'Cuarzo')}
-- **Salpicadero:** {materials.get('backsplash', 'Azulejo cerámico')}
-- **Paleta de colores:** {', '.join(colors)}
-
-¿Te gustaría hacer alguna modificación? Puedo ajustar colores, materiales, agregar o quitar elementos, cambiar el estilo, etc."""
+        response_text = DESIGN_RESPONSE_TEMPLATE.format(
+            version=new_version,
+            style=style,
+            shape_name=SHAPE_NAMES.get(shape, shape),
+            linear_meters=linear_meters,
+            cabinets=materials.get("cabinets", "MDF lacado"),
+            countertop=materials.get("countertop", "Cuarzo"),
+            backsplash=materials.get("backsplash", "Azulejo cerámico"),
+            colors=", ".join(colors)
+        )
 
         artifacts = [
             {
@@ -290,8 +690,10 @@ He creado un diseño de cocina **{style}** con configuración **{shape_names.get
             }
         ]
         
-        # Update design history
-        design_history = state.get("design_history", [])
+        # Update design history, keeping only the newest entries hot;
+        # evicted entries go to cold storage (put is non-blocking, the
+        # store's writer thread does the disk I/O)
+        design_history = state.design_history
         design_history.append({
             "version": new_version,
             "params": {
@@ -301,35 +703,46 @@ He creado un diseño de cocina **{style}** con configuración **{shape_names.get
                 "materials": materials
             }
         })
-        
+        while len(design_history) > _DESIGN_HISTORY_SIZE:
+            evicted = design_history.pop(0)
+            self._state_store.put_history_entry(
+                state.conversation_id, evicted["version"], evicted
+            )
+
         return {
             "response_text": response_text,
             "artifacts": artifacts,
-            "current_image": image_base64,
+            "current_image": self._put_image(
+                state.conversation_id, new_version, image_base64
+            ),
             "design_version": new_version,
-            "design_history": design_history
+            "design_history": design_history,
+            # Consumed (or superseded) either way; leaving it set would
+            # drag the full image list into every checkpoint
+            "_speculative_image": None
         }
     
     async def _edit_design(self, state: KitchenState) -> dict:
         """Edit existing kitchen design."""
         
-        current_image = state.get("current_image")
+        current_image = self._get_image(state.current_image)
         if not current_image:
             # No current design, generate new one
             return await self._generate_design(state)
-        
+
         # Get edit instructions from last message
-        messages = state.get("messages", [])
+        messages = state.messages
         edit_instructions = messages[-1].get("content", "") if messages else ""
-        
-        # Edit image
+
+        # Edit image; the raw bytes go straight through, no base64
+        # round-trip on a multi-megabyte payload
         result = await edit_kitchen_image(
-            base_image=current_image,
+            base_image=current_image.data,
             edit_instructions=edit_instructions,
             current_params={
-                "linear_meters": state.get("linear_meters"),
-                "shape": state.get("shape"),
-                "style": state.get("style")
+                "linear_meters": state.linear_meters,
+                "shape": state.shape,
+                "style": state.style
             }
         )
         
@@ -338,7 +751,7 @@ He creado un diseño de cocina **{style}** con configuración **{shape_names.get
             return {
                 "response_text": f"Estoy regenerando el diseño con tus modificaciones...",
                 "artifacts": [],
-                "action": "generate"  # Trigger regeneration
+                "action": Action.GENERATE  # Trigger regeneration
             }
         
         images = result.get("images", [])
@@ -346,13 +759,9 @@ He creado un diseño de cocina **{style}** con configuración **{shape_names.get
             return await self._generate_design(state)
         
         image_base64 = images[0]
-        new_version = state.get("design_version", 0) + 1
-        
-        response_text = f"""## Diseño Actualizado - Versión {new_version}
+        new_version = state.design_version + 1
 
-He aplicado las modificaciones solicitadas al diseño. 
-
-¿Qué te parece? Puedo seguir ajustando cualquier detalle que necesites."""
+        response_text = EDIT_RESPONSE_TEMPLATE.format(version=new_version)
 
         artifacts = [
             {
@@ -369,14 +778,16 @@ He aplicado las modificaciones solicitadas al diseño.
         return {
             "response_text": response_text,
             "artifacts": artifacts,
-            "current_image": image_base64,
+            "current_image": self._put_image(
+                state.conversation_id, new_version, image_base64
+            ),
             "design_version": new_version
         }
     
     async def _generate_response(self, state: KitchenState) -> dict:
         """Generate conversational response without image generation."""
         
-        messages = state.get("messages", [])
+        messages = state.messages
         if not messages:
             return {"response_text": "¡Hola! Soy KitchenMaster AI, tu experto en diseño de cocinas integrales. ¿En qué puedo ayudarte hoy?"}
         
@@ -388,102 +799,35 @@ He aplicado las modificaciones solicitadas al diseño.
                 "content": msg.get("content", "")
             })
         
-        self.reasoner.start_chat(chat_history)
-        
         last_message = messages[-1].get("content", "")
-        response = await self.reasoner.send_message(last_message)
-        
-        return {
-            "response_text": response,
-            "artifacts": []
-        }
-    
-    async def _format_output(self, state: KitchenState) -> dict:
-        """Format final output."""
-        return {
-            "response_text": state.get("response_text", ""),
-            "artifacts": state.get("artifacts", [])
-        }
-    
-    def _generate_specs(
-        self, 
-        linear_meters: float, 
-        shape: str, 
-        style: str, 
-        materials: dict
-    ) -> str:
-        """Generate technical specifications."""
-        
-        # Calculate module distribution based on meters
-        modules = []
-        remaining = linear_meters
-        
-        # Standard modules
-        if remaining >= 0.9:
-            modules.append("1x Módulo fregadero (90cm)")
-            remaining -= 0.9
-        if remaining >= 0.6:
-            modules.append("1x Módulo estufa/parrilla (60cm)")
-            remaining -= 0.6
-        if remaining >= 0.6:
-            modules.append("1x Módulo refrigerador (60cm)")
-            remaining -= 0.6
-        
-        # Fill rest with storage
-        storage_60 = int(remaining / 0.6)
-        remaining -= storage_60 * 0.6
-        storage_40 = int(remaining / 0.4)
-        
-        if storage_60 > 0:
-            modules.append(f"{storage_60}x Módulo almacenamiento (60cm)")
-        if storage_40 > 0:
-            modules.append(f"{storage_40}x Módulo almacenamiento (40cm)")
-        
-        module_distribution = "\n".join(f"- {m}" for m in modules)
-        
-        # Appliances
-        appliances = """- Campana extractora
-- Estufa/Parrilla 4 quemadores
-- Horno empotrable (opcional)
-- Refrigerador
-- Microondas empotrable (opcional)
-- Lavavajillas (opcional)"""
-        
-        # Cost estimation based on budget
-        cost_ranges = {
-            "low": "$15,000 - $25,000 MXN",
-            "medium": "$25,000 - $45,000 MXN",
-            "high": "$45,000 - $80,000 MXN",
-            "premium": "$80,000 - $150,000+ MXN"
-        }
-        
-        specs = f"""## Especificaciones Técnicas
 
-### Dimensiones
-- **Metros lineales:** {linear_meters}m
-- **Configuración:** {shape}
-- **Altura muebles bajos:** 85 cm
-- **Altura muebles altos:** 80 cm
-- **Profundidad muebles bajos:** 60 cm
-
-### Materiales
-- **Gabinetes:** {materials.get('cabinets', 'MDF lacado')}
-- **Cubierta:** {materials.get('countertop', 'Cuarzo')}
-- **Salpicadero:** {materials.get('backsplash', 'Azulejo')}
-- **Herrajes:** Cierre suave, bisagras de 110°
+        cache_key = self._response_cache_key(last_message, state)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            self._response_cache.move_to_end(cache_key)
+            return {
+                "response_text": cached,
+                "artifacts": []
+            }
 
-### Distribución de Módulos
-{module_distribution}
+        chat = self.reasoner.start_chat(chat_history)
 
-### Electrodomésticos Sugeridos
-{appliances}
+        writer = self._stream_writer()
+        parts = []
+        async for chunk in self.reasoner.send_message_stream(last_message, chat=chat):
+            parts.append(chunk)
+            if writer:
+                writer({"type": "text_delta", "content": chunk})
+        response = "".join(parts)
 
-### Estimación de Inversión
-Rango aproximado: {cost_ranges.get('medium', '$30,000 - $50,000 MXN')}
+        self._response_cache[cache_key] = response
+        if len(self._response_cache) > _RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
 
-*Nota: Los precios son aproximados y pueden variar según proveedor y ubicación.*"""
-        
-        return specs
+        return {
+            "response_text": response,
+            "artifacts": []
+        }
     
     async def run(
         self,
@@ -505,53 +849,133 @@ Rango aproximado: {cost_ranges.get('medium', '$30,000 - $50,000 MXN')}
             Dict with response_text, artifacts, and updated state
         """
         
-        # Build initial state
-        state = existing_state or {
-            "messages": [],
-            "user_id": user_id,
-            "conversation_id": conversation_id,
-            "linear_meters": None,
-            "shape": None,
-            "style": None,
-            "materials": {},
-            "colors": [],
-            "budget": None,
-            "current_image": None,
-            "design_version": 0,
-            "design_history": [],
-            "action": None,
-            "needs_clarification": False,
-            "questions": [],
-            "response_text": "",
-            "artifacts": [],
-            "error": None
+        state, config, thread_id = self._prepare_state(
+            user_message, user_id, conversation_id, existing_state
+        )
+
+        result = await self.graph.ainvoke(state, config)
+
+        return self._finalize(_as_state_dict(result), thread_id)
+
+    async def run_stream(
+        self,
+        user_message: str,
+        user_id: str,
+        conversation_id: str,
+        existing_state: dict = None
+    ):
+        """
+        Run the agent yielding incremental events instead of a single result.
+
+        Yields dicts shaped for streaming clients:
+        - {"type": "status", "content": ...} progress indicators
+        - {"type": "text_delta", "content": ...} partial LLM output
+        - {"type": "text", "content": ...} full response text
+        - {"type": "artifact", "artifact": {...}} each generated artifact
+        - {"type": "done", "state": {...}} final state, always last
+        """
+        state, config, thread_id = self._prepare_state(
+            user_message, user_id, conversation_id, existing_state
+        )
+
+        result = _as_state_dict(state)
+
+        async for mode, payload in self.graph.astream(
+            state, config, stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                # Events emitted by nodes via the stream writer
+                yield payload
+                continue
+
+            for update in payload.values():
+                if not update:
+                    continue
+                for artifact in update.get("artifacts") or []:
+                    yield {"type": "artifact", "artifact": artifact}
+                if update.get("response_text"):
+                    yield {"type": "text", "content": update["response_text"]}
+                # Mirror the reducer semantics: messages append, rest replace
+                for key, value in update.items():
+                    if key == "messages":
+                        result["messages"] = result.get("messages", []) + value
+                    else:
+                        result[key] = value
+
+        final = self._finalize(result, thread_id)
+        yield {
+            "type": "done",
+            "response_text": final["response_text"],
+            "artifacts": final["artifacts"],
+            "state": final["state"]
         }
-        
+
+    def _prepare_state(
+        self,
+        user_message: str,
+        user_id: str,
+        conversation_id: str,
+        existing_state: dict = None
+    ) -> tuple:
+        """Build the initial graph state and invocation config for a turn."""
+
+        thread_id = f"{user_id}:{conversation_id}"
+
+        # Without an explicit external state, continue from the last final
+        # state checkpointed for this thread (end-of-workflow mode)
+        if existing_state is None:
+            existing_state = self._state_store.get(thread_id)
+
+        # External state carries the raw image payload; move it into the
+        # image store and keep only the reference key in graph state.
+        # States from a previous turn in-process already hold a live reference.
+        if existing_state and existing_state.get("current_image"):
+            if self._get_image(existing_state["current_image"]) is None:
+                existing_state["current_image"] = self._put_image(
+                    conversation_id,
+                    existing_state.get("design_version", 0),
+                    existing_state["current_image"]
+                )
+
+        # Build initial state
+        if existing_state:
+            state = _state_from_dict(existing_state)
+        else:
+            state = KitchenState(user_id=user_id, conversation_id=conversation_id)
+
         # Add new message
-        state["messages"] = state.get("messages", []) + [{
+        state.messages = state.messages + [{
             "role": "user",
             "content": user_message
         }]
-        
-        # Run graph
-        config = {"configurable": {"thread_id": f"{user_id}:{conversation_id}"}}
-        
-        result = await self.graph.ainvoke(state, config)
-        
-        # Extract response
+
+        config = {"configurable": {"thread_id": thread_id}}
+
+        return state, config, thread_id
+
+    def _finalize(self, result: dict, thread_id: str) -> dict:
+        """Checkpoint the terminal state and shape the external result."""
+
+        image = self._get_image(result.get("current_image"))
+        image_base64 = image.base64 if image else None
+
+        # End-of-workflow checkpoint: persist only the terminal state, with
+        # the image reference resolved so restores survive a restart
+        if self.memory is None:
+            persisted = dict(result)
+            persisted["current_image"] = image_base64
+            # Never checkpoint an unconsumed speculation; it duplicates
+            # the image payload and would rehydrate stale into next turn
+            persisted.pop("_speculative_image", None)
+            self._state_store.put(thread_id, persisted)
+
+        # View over the result keyed by the external schema; values are
+        # shared by reference, only the envelope is allocated
+        state_view = {key: result.get(key) for key in _EXTERNAL_STATE_KEYS}
+        state_view["current_image"] = image_base64
+
         return {
             "response_text": result.get("response_text", ""),
             "artifacts": result.get("artifacts", []),
-            "state": {
-                "linear_meters": result.get("linear_meters"),
-                "shape": result.get("shape"),
-                "style": result.get("style"),
-                "materials": result.get("materials"),
-                "colors": result.get("colors"),
-                "budget": result.get("budget"),
-                "current_image": result.get("current_image"),
-                "design_version": result.get("design_version"),
-                "design_history": result.get("design_history"),
-                "messages": result.get("messages")
-            }
+            "state": state_view
         }
@@ -94,6 +94,11 @@ EDIT_IMAGE_PROMPT = """Modifica la imagen de cocina anterior con los siguientes
 Modify this kitchen design to {edit_instructions}. Keep the overall layout and dimensions the same. 
 Make the changes look natural and professionally integrated into the existing design."""
 
+# UTF-8 form of the system prompt, encoded once at import; callers that
+# serialize the prompt onto the wire can reuse this instead of re-encoding
+# the ~2KB string per session
+SYSTEM_PROMPT_BYTES = SYSTEM_PROMPT.encode("utf-8")
+
 SPECS_TEMPLATE = """## Especificaciones Técnicas del Diseño
 
 ### Dimensiones Generales
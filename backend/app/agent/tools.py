@@ -1,17 +1,145 @@
 from google import genai
 from google.genai import types
+import orjson
+import asyncio
 import base64
+import functools
 import io
+import os
+import re
+import threading
+import time
 from typing import Optional, Dict, Any
 from PIL import Image
 
+try:
+    # OpenCV's PNG encoder is several times faster than PIL's; optional,
+    # PIL remains the fallback
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+    np = None
+
+from app.agent.prompts import SYSTEM_PROMPT
 from app.config import get_settings
+from app.services import cache as result_cache
 
 settings = get_settings()
 
+# Fence-tolerant JSON extraction: prefer a ```json ... ``` block, else
+# take the widest brace span; compiled once instead of scanning the
+# response twice with find/rfind
+_JSON_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```|(\{.*\})", re.DOTALL)
+
 # Initialize Gemini client
 client = genai.Client(api_key=settings.google_api_key)
 
+# Shared handle for the provider-side cached system prompt.
+# The system prompt is static and large (~500 tokens), so we upload it once
+# per process and reference it by name instead of resending it every turn.
+# Creation runs in a background thread so chat turns never wait on the
+# upload; while it's pending — or after a failure, until the retry window
+# passes — the prompt is simply sent inline.
+_PROMPT_CACHE_TTL_SECONDS = 3600
+_PROMPT_CACHE_RETRY_SECONDS = 900
+_cached_prompt_name: Optional[str] = None
+_cached_prompt_expires_at: float = 0.0
+_prompt_cache_lock = threading.Lock()
+_prompt_cache_pending = False
+
+
+def _create_prompt_cache(model_name: str, system_prompt: str) -> None:
+    global _cached_prompt_name, _cached_prompt_expires_at, _prompt_cache_pending
+    try:
+        cache = client.caches.create(
+            model=model_name,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prompt,
+                ttl=f"{_PROMPT_CACHE_TTL_SECONDS}s"
+            )
+        )
+    except Exception:
+        # Caching unavailable (e.g. prompt below minimum token count);
+        # remember the failure so following turns don't retry a doomed
+        # call
+        with _prompt_cache_lock:
+            _cached_prompt_name = None
+            _cached_prompt_expires_at = time.monotonic() + _PROMPT_CACHE_RETRY_SECONDS
+            _prompt_cache_pending = False
+    else:
+        with _prompt_cache_lock:
+            _cached_prompt_name = cache.name
+            # Refresh slightly before the provider-side TTL expires
+            _cached_prompt_expires_at = time.monotonic() + _PROMPT_CACHE_TTL_SECONDS - 60
+            _prompt_cache_pending = False
+
+
+def get_cached_system_prompt(model_name: str, system_prompt: str) -> Optional[str]:
+    """
+    Get the cached-content handle for the system prompt, if available.
+
+    Returns the cache name to pass as `cached_content`, or None while
+    creation is pending, after a recent failure, or once the handle has
+    expired and is being refreshed.
+    """
+    global _prompt_cache_pending
+    with _prompt_cache_lock:
+        if time.monotonic() < _cached_prompt_expires_at:
+            return _cached_prompt_name
+        if not _prompt_cache_pending:
+            _prompt_cache_pending = True
+            threading.Thread(
+                target=_create_prompt_cache,
+                args=(model_name, system_prompt),
+                daemon=True
+            ).start()
+    return None
+
+
+def _encode_image_base64(img) -> str:
+    """
+    Encode a generated image to a base64 PNG string.
+
+    Prefers cv2.imencode, which is markedly faster than PIL's PNG writer
+    and encodes straight into a numpy buffer with no BytesIO intermediary;
+    falls back to the PIL path when OpenCV is unavailable.
+    """
+    # The Imagen response already carries encoded PNG bytes; when the SDK
+    # exposes them, base64 the existing payload through a memoryview (no
+    # copy) and skip the decode/re-encode round-trip entirely
+    raw = getattr(img, "image_bytes", None)
+    if raw:
+        return base64.b64encode(memoryview(raw)).decode("ascii")
+
+    if cv2 is not None:
+        try:
+            arr = np.asarray(img)
+            if arr.ndim == 3 and arr.shape[2] >= 3:
+                arr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+            ok, buf = cv2.imencode(".png", arr, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+            if ok:
+                return base64.b64encode(buf.tobytes()).decode("ascii")
+        except Exception:
+            pass
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("ascii")
+
+
+# Caps concurrent encode threads so bursts don't oversubscribe the CPU
+_encode_semaphore = asyncio.Semaphore(os.cpu_count() or 2)
+
+# Longest edge allowed on images sent to Gemini for edit analysis
+_MAX_EDIT_IMAGE_EDGE = 1024
+
+
+async def _encode_image_base64_async(img) -> str:
+    """Run _encode_image_base64 in a worker thread, bounded by CPU count."""
+    async with _encode_semaphore:
+        return await asyncio.to_thread(_encode_image_base64, img)
+
 
 class GeminiImageGenerator:
     """Wrapper for Gemini image generation capabilities."""
@@ -54,19 +182,19 @@ Details: Sharp focus on materials and textures, realistic reflections on surface
             if negative_prompt:
                 config.negative_prompt = negative_prompt
 
-            response = client.models.generate_images(
+            response = await client.aio.models.generate_images(
                 model=self.imagen_model,
                 prompt=enhanced_prompt,
                 config=config
             )
             
-            images = []
-            for gen_image in response.generated_images:
-                # Convert to base64
-                buffered = io.BytesIO()
-                gen_image.image.save(buffered, format="PNG")
-                img_base64 = base64.b64encode(buffered.getvalue()).decode()
-                images.append(img_base64)
+            # Encode off the event loop; multi-image batches encode in
+            # parallel and concurrent /chat requests are never head-of-line
+            # blocked behind a PNG pass
+            images = list(await asyncio.gather(*(
+                _encode_image_base64_async(gen_image.image)
+                for gen_image in response.generated_images
+            )))
             
             return {
                 "success": True,
@@ -83,7 +211,7 @@ Details: Sharp focus on materials and textures, realistic reflections on surface
     
     async def edit_image(
         self,
-        base_image: str,  # base64 encoded
+        base_image,  # base64 string or raw encoded bytes
         edit_prompt: str,
         mask_image: str = None  # optional base64 mask
     ) -> Dict[str, Any]:
@@ -95,13 +223,25 @@ Details: Sharp focus on materials and textures, realistic reflections on surface
         use the actual edit endpoint.
         """
         try:
-            # Decode base image
-            img_data = base64.b64decode(base_image)
-            img = Image.open(io.BytesIO(img_data))
-            
+            # Decode base image; raw bytes from our own pipeline skip the
+            # base64 round-trip entirely. BytesIO over an unmodified bytes
+            # object is copy-on-write, so the payload is held exactly once
+            raw = base64.b64decode(base_image) if isinstance(base_image, str) else base_image
+            img = Image.open(io.BytesIO(raw))
+
+            # Downscale before shipping to Gemini: past ~1024px the extra
+            # resolution adds token cost and upload bytes but no signal
+            # for the description pass
+            scale = _MAX_EDIT_IMAGE_EDGE / max(img.size)
+            if scale < 1:
+                img = img.resize(
+                    (int(img.width * scale), int(img.height * scale)),
+                    Image.Resampling.LANCZOS
+                )
+
             # For actual editing, we'll use Gemini's multimodal capabilities
             # to understand the image and generate a new one based on edits
-            analysis_response = client.models.generate_content(
+            analysis_response = await client.aio.models.generate_content(
                 model='gemini-2.0-flash',
                 contents=[
                     "Describe this kitchen design in detail, including layout, materials, colors, and style. Be specific about dimensions and features visible.",
@@ -131,6 +271,26 @@ Create an updated version maintaining the same overall layout and dimensions."""
             }
 
 
+# JSON structure expected from request analysis, shared by the single and
+# batched prompts
+ANALYSIS_SCHEMA = """{
+    "action": "generate" | "edit" | "question" | "clarification",
+    "linear_meters": number | null,
+    "shape": "I" | "L" | "U" | "G" | "parallel" | null,
+    "style": "modern" | "classic" | "rustic" | "minimalist" | "industrial" | "scandinavian" | "contemporary" | null,
+    "materials": {
+        "cabinets": string | null,
+        "countertop": string | null,
+        "backsplash": string | null
+    },
+    "colors": [string] | null,
+    "budget": "low" | "medium" | "high" | "premium" | null,
+    "edit_instructions": string | null,
+    "questions_to_ask": [string] | null,
+    "special_requirements": string | null
+}"""
+
+
 class GeminiReasoner:
     """Wrapper for Gemini reasoning/chat capabilities."""
     
@@ -140,30 +300,57 @@ class GeminiReasoner:
         self.chat = None
     
     def start_chat(self, history: list = None):
-        """Initialize or reset chat with history."""
-        config = types.GenerateContentConfig(
-            system_instruction=self.system_prompt,
-            temperature=0.7
-        )
+        """Create a chat session with history; also kept as the default."""
+        cached_prompt = get_cached_system_prompt(self.model_name, self.system_prompt)
+
+        if cached_prompt:
+            # Reuse the provider-side cached prefix instead of resending
+            # the system prompt as input tokens on every turn
+            config = types.GenerateContentConfig(
+                cached_content=cached_prompt,
+                temperature=0.7
+            )
+        else:
+            config = types.GenerateContentConfig(
+                system_instruction=self.system_prompt,
+                temperature=0.7
+            )
         
-        self.chat = client.chats.create(
+        # The full prior exchange seeds the chat at creation — no API
+        # traffic to restore context. Gemini names the assistant role
+        # "model"
+        chat_history = [
+            types.Content(
+                role="model" if msg["role"] == "assistant" else "user",
+                parts=[types.Part.from_text(text=msg["content"])]
+            )
+            for msg in (history or [])
+            if msg.get("content")
+        ]
+
+        chat = client.aio.chats.create(
             model=self.model_name,
-            config=config
+            config=config,
+            history=chat_history
         )
-        
-        # Replay history if provided
-        if history:
-            for msg in history:
-                if msg["role"] == "user":
-                    self.chat.send_message(msg["content"])
-    
-    async def send_message(self, message: str) -> str:
+
+        self.chat = chat
+        return chat
+
+    async def send_message(self, message: str, chat=None) -> str:
         """Send message and get response."""
-        if not self.chat:
-            self.start_chat()
-        
-        response = self.chat.send_message(message)
+        chat = chat or self.chat or self.start_chat()
+
+        response = await chat.send_message(message)
         return response.text
+
+    async def send_message_stream(self, message: str, chat=None):
+        """Send message and yield response text chunks as they arrive."""
+        chat = chat or self.chat or self.start_chat()
+
+        async for chunk in await chat.send_message_stream(message):
+            if chunk.text:
+                yield chunk.text
     
     async def analyze_request(self, user_message: str, context: dict = None) -> Dict[str, Any]:
         """
@@ -185,36 +372,19 @@ Mensaje del usuario: "{user_message}"
 Contexto previo: {context or 'Ninguno'}
 
 Responde SOLO con un JSON válido con esta estructura:
-{{
-    "action": "generate" | "edit" | "question" | "clarification",
-    "linear_meters": number | null,
-    "shape": "I" | "L" | "U" | "G" | "parallel" | null,
-    "style": "modern" | "classic" | "rustic" | "minimalist" | "industrial" | "scandinavian" | "contemporary" | null,
-    "materials": {{
-        "cabinets": string | null,
-        "countertop": string | null,
-        "backsplash": string | null
-    }},
-    "colors": [string] | null,
-    "budget": "low" | "medium" | "high" | "premium" | null,
-    "edit_instructions": string | null,
-    "questions_to_ask": [string] | null,
-    "special_requirements": string | null
-}}"""
+{ANALYSIS_SCHEMA}"""
         
-        response = await self.send_message(analysis_prompt)
+        # Analysis runs on its own session so concurrent turns on a shared
+        # reasoner don't interleave histories
+        response = await self.send_message(analysis_prompt, chat=self.start_chat())
         
-        # Parse JSON from response
-        import json
-        try:
-            # Try to extract JSON from response
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
+        # Parse JSON from response, tolerating Markdown code fences
+        match = _JSON_RE.search(response)
+        if match:
+            try:
+                return orjson.loads(match.group(1) or match.group(2))
+            except orjson.JSONDecodeError:
+                pass
         
         # Default if parsing fails
         return {
@@ -223,6 +393,219 @@ Responde SOLO con un JSON válido con esta estructura:
         }
 
 
+class AnalysisBatcher:
+    """
+    Coalesce concurrent request analyses into a single LLM call.
+
+    Callers submit a message through analyze() and await a future that is
+    resolved when their batch flushes. A flush happens once MAX_BATCH
+    items are pending or MAX_WAIT_MS has passed since the first item
+    arrived, whichever comes first. The batch is sent as one prompt
+    asking for a JSON array, and the results are matched back to callers
+    by position. Single-item batches take the normal analyze_request path.
+    """
+
+    def __init__(
+        self,
+        reasoner: "GeminiReasoner",
+        max_batch: int = None,
+        max_wait_ms: int = None
+    ):
+        self.reasoner = reasoner
+        self.max_batch = max_batch or settings.analysis_batch_size
+        self.max_wait_ms = max_wait_ms or settings.analysis_batch_wait_ms
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._drainer: Optional[asyncio.Task] = None
+
+    async def analyze(self, user_message: str, context: dict = None) -> Dict[str, Any]:
+        """Queue an analysis and wait for its batched result."""
+        # Exact-match cache: identical message/context pairs share one
+        # analysis across turns, users and processes
+        key = result_cache.cache_key(
+            "analyze", {"message": user_message.strip().lower(), "context": context}
+        )
+        cached = await result_cache.get_cached(key)
+        if cached is not None:
+            return cached
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((user_message, context, future))
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.create_task(self._drain())
+        result = await future
+
+        # Edits depend on conversation-specific side state; only share
+        # informational and generation analyses
+        if result.get("action") in ("question", "generate"):
+            await result_cache.set_cached(key, result)
+        return result
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        if len(batch) == 1:
+            message, context, future = batch[0]
+            try:
+                result = await self.reasoner.analyze_request(message, context)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+            return
+
+        try:
+            results = await self._analyze_batch(batch)
+        except Exception:
+            # Batched call or parsing failed; fall back to individual
+            # analyses rather than failing every turn in the batch
+            results = await asyncio.gather(
+                *(self.reasoner.analyze_request(message, context)
+                  for message, context, _ in batch),
+                return_exceptions=True
+            )
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _analyze_batch(self, batch: list) -> list:
+        """Analyze all queued messages with a single prompt."""
+        sections = "\n\n".join(
+            f'Mensaje {i + 1}: "{message}"\n'
+            f'Contexto previo {i + 1}: {context or "Ninguno"}'
+            for i, (message, context, _) in enumerate(batch)
+        )
+
+        batch_prompt = f"""Analiza los siguientes {len(batch)} mensajes de usuarios (independientes entre sí) y extrae los parámetros de diseño de cocina de cada uno.
+Si algún parámetro no se menciona, devuelve null para ese campo.
+
+{sections}
+
+Responde SOLO con un arreglo JSON de {len(batch)} objetos, en el mismo orden que los mensajes, cada uno con esta estructura:
+{ANALYSIS_SCHEMA}"""
+
+        response = await self.reasoner.send_message(
+            batch_prompt, chat=self.reasoner.start_chat()
+        )
+
+        json_start = response.find('[')
+        json_end = response.rfind(']') + 1
+        results = orjson.loads(response[json_start:json_end])
+        if not isinstance(results, list) or len(results) != len(batch):
+            raise ValueError("batched analysis returned wrong item count")
+        return results
+
+
+# Shared wrapper instances: SDK client setup, connection pools and the
+# cached-prompt handle are reused instead of being rebuilt per agent
+_singleton_lock = threading.Lock()
+_reasoner: Optional["GeminiReasoner"] = None
+_image_generator: Optional["GeminiImageGenerator"] = None
+_analysis_batcher: Optional["AnalysisBatcher"] = None
+
+
+def get_reasoner() -> "GeminiReasoner":
+    """Get the process-wide GeminiReasoner instance."""
+    global _reasoner
+    if _reasoner is None:
+        with _singleton_lock:
+            if _reasoner is None:
+                _reasoner = GeminiReasoner(SYSTEM_PROMPT)
+    return _reasoner
+
+
+def get_image_generator() -> "GeminiImageGenerator":
+    """Get the process-wide GeminiImageGenerator instance."""
+    global _image_generator
+    if _image_generator is None:
+        with _singleton_lock:
+            if _image_generator is None:
+                _image_generator = GeminiImageGenerator()
+    return _image_generator
+
+
+def get_analysis_batcher() -> "AnalysisBatcher":
+    """Get the process-wide AnalysisBatcher instance."""
+    global _analysis_batcher
+    if _analysis_batcher is None:
+        with _singleton_lock:
+            if _analysis_batcher is None:
+                _analysis_batcher = AnalysisBatcher(get_reasoner())
+    return _analysis_batcher
+
+
+# Prompt fragments for image generation, built once at import instead of
+# per call
+SHAPE_DESCRIPTIONS = {
+    "I": "single wall linear",
+    "L": "L-shaped corner",
+    "U": "U-shaped three-wall",
+    "G": "G-shaped with peninsula",
+    "parallel": "galley parallel walls"
+}
+
+STYLE_ATMOSPHERES = {
+    "modern": "clean lines, minimalist hardware, integrated appliances",
+    "classic": "ornate moldings, traditional hardware, warm wood tones",
+    "rustic": "natural wood, farmhouse sink, open shelving, vintage elements",
+    "minimalist": "handleless cabinets, hidden appliances, monochromatic palette",
+    "industrial": "exposed brick, metal accents, concrete elements, pendant lights",
+    "scandinavian": "light wood, white walls, natural light, simple forms",
+    "contemporary": "mixed materials, statement lighting, current trends"
+}
+
+_KITCHEN_PROMPT_TEMPLATE = """{shape_desc} kitchen design, {linear_meters} linear meters total
+
+Style: {style} kitchen with {atmosphere}
+Cabinets: {cabinets}
+Countertops: {countertop}
+Backsplash: {backsplash}
+Color scheme: {colors}
+{additional_details}
+
+Features: functional layout, proper work triangle, adequate storage, integrated lighting"""
+
+
+@functools.lru_cache(maxsize=512)
+def _build_kitchen_prompt(
+    linear_meters: float,
+    shape: str,
+    style: str,
+    materials_items: frozenset,
+    colors: tuple,
+    additional_details: str
+) -> str:
+    """Build the generation prompt; memoized per full parameter tuple."""
+    materials = dict(materials_items)
+    return _KITCHEN_PROMPT_TEMPLATE.format(
+        shape_desc=SHAPE_DESCRIPTIONS.get(shape, "L-shaped"),
+        linear_meters=linear_meters,
+        style=style,
+        atmosphere=STYLE_ATMOSPHERES.get(style, "modern aesthetics"),
+        cabinets=materials["cabinets"],
+        countertop=materials["countertop"],
+        backsplash=materials["backsplash"],
+        colors=", ".join(colors),
+        additional_details=additional_details
+    )
+
+
 # Utility functions for the agent
 async def generate_kitchen_image(
     linear_meters: float,
@@ -240,50 +623,43 @@ async def generate_kitchen_image(
         "backsplash": "subway tiles"
     }
     colors = colors or ["white", "gray", "wood tones"]
+
+    # Identical parameter sets produce an equivalent design; serve those
+    # straight from Redis instead of re-running the image model
+    key = result_cache.cache_key("image", {
+        "linear_meters": linear_meters,
+        "shape": shape,
+        "style": style,
+        "materials": materials,
+        "colors": colors,
+        "additional_details": additional_details
+    })
+    cached = await result_cache.get_cached(key)
+    if cached is not None:
+        return cached
     
-    shape_descriptions = {
-        "I": "single wall linear",
-        "L": "L-shaped corner",
-        "U": "U-shaped three-wall",
-        "G": "G-shaped with peninsula",
-        "parallel": "galley parallel walls"
-    }
-    
-    style_atmospheres = {
-        "modern": "clean lines, minimalist hardware, integrated appliances",
-        "classic": "ornate moldings, traditional hardware, warm wood tones",
-        "rustic": "natural wood, farmhouse sink, open shelving, vintage elements",
-        "minimalist": "handleless cabinets, hidden appliances, monochromatic palette",
-        "industrial": "exposed brick, metal accents, concrete elements, pendant lights",
-        "scandinavian": "light wood, white walls, natural light, simple forms",
-        "contemporary": "mixed materials, statement lighting, current trends"
-    }
-    
-    prompt = f"""{shape_descriptions.get(shape, 'L-shaped')} kitchen design, {linear_meters} linear meters total
+    prompt = _build_kitchen_prompt(
+        linear_meters, shape, style,
+        frozenset(materials.items()), tuple(colors), additional_details
+    )
 
-Style: {style} kitchen with {style_atmospheres.get(style, 'modern aesthetics')}
-Cabinets: {materials['cabinets']}
-Countertops: {materials['countertop']}
-Backsplash: {materials['backsplash']}
-Color scheme: {', '.join(colors)}
-{additional_details}
+    generator = get_image_generator()
+    result = await generator.generate_image(prompt)
 
-Features: functional layout, proper work triangle, adequate storage, integrated lighting"""
+    if result.get("success"):
+        await result_cache.set_cached(key, result)
 
-    generator = GeminiImageGenerator()
-    result = await generator.generate_image(prompt)
-    
     return result
 
 
 async def edit_kitchen_image(
-    base_image: str,
+    base_image,
     edit_instructions: str,
     current_params: dict = None
 ) -> Dict[str, Any]:
     """Edit an existing kitchen design image."""
     
-    generator = GeminiImageGenerator()
+    generator = get_image_generator()
     result = await generator.edit_image(base_image, edit_instructions)
     
     return result
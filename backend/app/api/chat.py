@@ -1,33 +1,48 @@
-import json
 import asyncio
+import base64
 from typing import Optional
 from uuid import UUID
 
+import orjson
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 import redis.asyncio as redis
 
 from app.database import get_db, AsyncSessionLocal
-from app.api.deps import get_current_user, get_redis
+from app.api.deps import get_current_user, get_redis, get_shared_redis
 from app.models.user import User
 from app.schemas.chat import ChatRequest, ChatResponse, StreamChunk, ArtifactData
 from app.schemas.conversation import ConversationCreate
 from app.services.conversation import ConversationService
 from app.services.auth import AuthService
+from app.services import storage
 from app.agent.kitchen_agent import KitchenDesignAgent
 
 router = APIRouter()
 
-# Store agent instances per user session
-agent_cache = {}
+# Agent instances per user session, bounded and expiring so memory stays
+# constant instead of growing with every user ever seen. Idle agents age
+# out after an hour; their conversation state lives in Redis and the
+# agent's own checkpoint store, so eviction loses nothing durable.
+agent_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_agent_cache_lock = asyncio.Lock()
 
 
-def get_or_create_agent(user_id: str) -> KitchenDesignAgent:
-    """Get or create agent instance for user."""
-    if user_id not in agent_cache:
-        agent_cache[user_id] = KitchenDesignAgent()
-    return agent_cache[user_id]
+def _b64_to_bytes(encoded: Optional[str]) -> Optional[bytes]:
+    """Decode a base64 payload to the raw bytes persisted in the database."""
+    return base64.b64decode(encoded) if encoded else None
+
+
+async def get_or_create_agent(user_id: str) -> KitchenDesignAgent:
+    """Get or create the agent instance for a user."""
+    async with _agent_cache_lock:
+        agent = agent_cache.get(user_id)
+        if agent is None:
+            agent = KitchenDesignAgent()
+            agent_cache[user_id] = agent
+        return agent
 
 
 @router.post("", response_model=ChatResponse)
@@ -60,21 +75,17 @@ async def chat(
             ConversationCreate(title="Nueva Cocina")
         )
     
-    # Save user message
-    user_message = await ConversationService.add_message(
-        db,
-        conversation.id,
-        "user",
-        request.message
-    )
-    
-    # Get agent state from Redis
+    # Save user message and fetch agent state concurrently; the INSERT
+    # and the Redis round-trip are independent
     state_key = f"agent_state:{current_user.id}:{conversation.id}"
-    existing_state = await redis_client.get(state_key)
-    existing_state = json.loads(existing_state) if existing_state else None
+    user_message, existing_state = await asyncio.gather(
+        ConversationService.add_message(db, conversation.id, "user", request.message),
+        redis_client.get(state_key)
+    )
+    existing_state = orjson.loads(existing_state) if existing_state else None
     
     # Run agent
-    agent = get_or_create_agent(str(current_user.id))
+    agent = await get_or_create_agent(str(current_user.id))
     
     try:
         result = await agent.run(
@@ -89,43 +100,57 @@ async def chat(
             detail=f"Error del agente: {str(e)}"
         )
     
-    # Save agent response
-    assistant_message = await ConversationService.add_message(
-        db,
-        conversation.id,
-        "assistant",
-        result["response_text"]
-    )
-    
-    # Save artifacts
-    artifacts_response = []
-    for artifact in result.get("artifacts", []):
-        saved_artifact = await ConversationService.add_artifact(
+    # Save agent response and persist state to Redis concurrently; the
+    # SET does not depend on any of the DB writes below
+    assistant_message, _ = await asyncio.gather(
+        ConversationService.add_message(
             db,
-            assistant_message.id,
-            artifact_type=artifact["type"],
-            title=artifact.get("title"),
-            content=artifact.get("content"),
-            image_url=artifact.get("image_url"),
-            image_data=artifact.get("image_data", "").encode() if artifact.get("image_data") else None,
-            metadata=artifact.get("metadata", {})
+            conversation.id,
+            "assistant",
+            result["response_text"]
+        ),
+        redis_client.set(
+            state_key,
+            orjson.dumps(result.get("state", {})),
+            ex=86400 * 7  # 7 days expiry
         )
-        
-        artifacts_response.append(ArtifactData(
+    )
+
+    # Save artifacts in one bulk insert; image payloads go to the local
+    # store and only their URL hits Postgres. Responses come from the
+    # in-memory dicts, no DB round-trip needed
+    artifacts = result.get("artifacts", [])
+    rows = []
+    for artifact in artifacts:
+        image_url = artifact.get("image_url")
+        raw = _b64_to_bytes(artifact.get("image_data"))
+        if raw:
+            image_url = await storage.save_image(raw)
+        rows.append({**artifact, "image_url": image_url})
+    await ConversationService.add_artifacts_bulk(db, assistant_message.id, rows)
+    # Agent output is already shaped; skip the construction-time
+    # validation pass
+    artifacts_response = [
+        ArtifactData.model_construct(
             type=artifact["type"],
             title=artifact.get("title", ""),
             content=artifact.get("content"),
             image_data=artifact.get("image_data"),
             metadata=artifact.get("metadata", {})
-        ))
+        )
+        for artifact in artifacts
+    ]
     
     # Save design iteration if image was generated
     if result.get("state", {}).get("current_image"):
+        image_url = await storage.save_image(
+            _b64_to_bytes(result["state"]["current_image"])
+        )
         await ConversationService.save_design_iteration(
             db,
             conversation.id,
             prompt=request.message,
-            image_data=result["state"]["current_image"].encode(),
+            image_url=image_url,
             parameters={
                 "linear_meters": result["state"].get("linear_meters"),
                 "shape": result["state"].get("shape"),
@@ -133,13 +158,6 @@ async def chat(
             }
         )
     
-    # Save state to Redis
-    await redis_client.set(
-        state_key,
-        json.dumps(result.get("state", {})),
-        ex=86400 * 7  # 7 days expiry
-    )
-    
     # Update conversation title if first design
     if result.get("state", {}).get("design_version") == 1:
         linear_m = result["state"].get("linear_meters", "")
@@ -192,9 +210,9 @@ async def websocket_chat(
             await websocket.close(code=4004, reason="Conversation not found")
             return
         
-        agent = get_or_create_agent(str(user.id))
-        redis_client = redis.from_url("redis://redis:6379", decode_responses=True)
-        
+        agent = await get_or_create_agent(str(user.id))
+        redis_client = get_shared_redis()
+
         try:
             while True:
                 # Receive message
@@ -205,23 +223,18 @@ async def websocket_chat(
                     continue
                 
                 # Send typing indicator
-                await websocket.send_json({
+                await websocket.send_bytes(orjson.dumps({
                     "type": "status",
                     "content": "thinking"
-                })
+                }))
                 
-                # Save user message
-                user_msg = await ConversationService.add_message(
-                    db,
-                    conversation_id,
-                    "user",
-                    message
-                )
-                
-                # Get state
+                # Save user message and fetch agent state concurrently
                 state_key = f"agent_state:{user.id}:{conversation_id}"
-                existing_state = await redis_client.get(state_key)
-                existing_state = json.loads(existing_state) if existing_state else None
+                user_msg, existing_state = await asyncio.gather(
+                    ConversationService.add_message(db, conversation_id, "user", message),
+                    redis_client.get(state_key)
+                )
+                existing_state = orjson.loads(existing_state) if existing_state else None
                 
                 # Run agent
                 try:
@@ -233,56 +246,72 @@ async def websocket_chat(
                     )
                     
                     # Send text response
-                    await websocket.send_json({
+                    await websocket.send_bytes(orjson.dumps({
                         "type": "text",
                         "content": result["response_text"]
-                    })
-                    
-                    # Send artifacts
+                    }))
+
+                    # Send artifacts: a metadata frame, then the image as
+                    # a raw binary frame (25% smaller than base64 and no
+                    # JSON escaping pass over megabytes of string)
                     for artifact in result.get("artifacts", []):
-                        await websocket.send_json({
+                        image_b64 = artifact.get("image_data")
+                        await websocket.send_bytes(orjson.dumps({
                             "type": "artifact",
                             "artifact": {
                                 "type": artifact["type"],
                                 "title": artifact.get("title", ""),
                                 "content": artifact.get("content"),
-                                "image_data": artifact.get("image_data"),
-                                "metadata": artifact.get("metadata", {})
+                                "metadata": artifact.get("metadata", {}),
+                                "binary_image": bool(image_b64)
                             }
-                        })
+                        }))
+                        if image_b64:
+                            await websocket.send_bytes(base64.b64decode(image_b64))
                     
-                    # Save to database
-                    assistant_msg = await ConversationService.add_message(
-                        db,
-                        conversation_id,
-                        "assistant",
-                        result["response_text"]
+                    # Save to database and Redis concurrently
+                    assistant_msg, _ = await asyncio.gather(
+                        ConversationService.add_message(
+                            db,
+                            conversation_id,
+                            "assistant",
+                            result["response_text"]
+                        ),
+                        redis_client.set(
+                            state_key,
+                            orjson.dumps(result.get("state", {})),
+                            ex=86400 * 7
+                        )
                     )
-                    
-                    # Save state
-                    await redis_client.set(
-                        state_key,
-                        json.dumps(result.get("state", {})),
-                        ex=86400 * 7
+
+                    # Persist artifacts with the same bulk path as the
+                    # HTTP handler: one INSERT, one commit
+                    rows = []
+                    for artifact in result.get("artifacts", []):
+                        image_url = artifact.get("image_url")
+                        raw = _b64_to_bytes(artifact.get("image_data"))
+                        if raw:
+                            image_url = await storage.save_image(raw)
+                        rows.append({**artifact, "image_url": image_url})
+                    await ConversationService.add_artifacts_bulk(
+                        db, assistant_msg.id, rows
                     )
-                    
+
                     # Send done
-                    await websocket.send_json({
+                    await websocket.send_bytes(orjson.dumps({
                         "type": "done",
                         "message_id": str(assistant_msg.id),
                         "design_version": result.get("state", {}).get("design_version")
-                    })
-                    
+                    }))
+
                 except Exception as e:
-                    await websocket.send_json({
+                    await websocket.send_bytes(orjson.dumps({
                         "type": "error",
                         "content": str(e)
-                    })
+                    }))
                     
         except WebSocketDisconnect:
             pass
-        finally:
-            await redis_client.close()
 
 
 @router.get("/history/{conversation_id}/designs")
@@ -323,7 +352,7 @@ async def get_design_history(
             "prompt": it.prompt_used,
             "parameters": it.parameters,
             "created_at": it.created_at.isoformat(),
-            "has_image": it.image_data is not None or it.image_url is not None
+            "has_image": it.image_url is not None
         }
         for it in iterations
     ]
@@ -26,26 +26,26 @@ async def list_conversations(
 ):
     """List all conversations for current user."""
     
-    conversations = await ConversationService.get_user_conversations(
-        db, 
+    rows = await ConversationService.get_user_conversations(
+        db,
         current_user.id,
         limit=limit,
         offset=offset
     )
-    
-    result = []
-    for conv in conversations:
-        last_msg = conv.messages[-1].content if conv.messages else None
-        result.append(ConversationList(
+
+    # Rows come straight from the database; model_construct skips a
+    # validation pass that FastAPI repeats against response_model anyway
+    return [
+        ConversationList.model_construct(
             id=conv.id,
             title=conv.title,
             created_at=conv.created_at,
             updated_at=conv.updated_at,
-            message_count=len(conv.messages) if hasattr(conv, 'messages') else 0,
-            last_message=last_msg[:100] if last_msg else None
-        ))
-    
-    return result
+            message_count=message_count,
+            last_message=last_message[:100] if last_message else None
+        )
+        for conv, message_count, last_message in rows
+    ]
 
 
 @router.post("", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED)
@@ -14,15 +14,25 @@ from app.models.user import User
 settings = get_settings()
 security = HTTPBearer()
 
-# Redis connection pool
+# Redis connection pool, shared by HTTP dependencies and WebSockets so
+# every request reuses established sockets instead of opening new ones
 redis_pool = None
 
 
-async def get_redis() -> redis.Redis:
+def get_shared_redis() -> redis.Redis:
+    """Return a Redis client backed by the process-wide connection pool."""
     global redis_pool
     if redis_pool is None:
-        redis_pool = redis.from_url(settings.redis_url, decode_responses=True)
-    return redis_pool
+        redis_pool = redis.ConnectionPool.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            max_connections=64
+        )
+    return redis.Redis(connection_pool=redis_pool)
+
+
+async def get_redis() -> redis.Redis:
+    return get_shared_redis()
 
 
 async def get_current_user(
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import random
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
@@ -12,8 +13,23 @@ engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=1800,
+    pool_timeout=5,
+    # asyncpg-level tuning: reuse prepared statements across the small,
+    # repetitive query set instead of re-parsing per execution; JIT only
+    # hurts short OLTP queries
+    connect_args={
+        "statement_cache_size": 1024,
+        "prepared_statement_cache_size": 256,
+        "server_settings": {
+            "jit": "off",
+            "application_name": "kitchenmaster",
+            # Query-time recall for the HNSW memory-embedding index
+            "hnsw.ef_search": "40"
+        }
+    }
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -37,23 +53,33 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
-async def init_db(max_retries: int = 30, retry_delay: int = 2):
+async def init_db(max_retries: int = 30):
     """Initialize database with retry logic for Docker Swarm."""
     for attempt in range(max_retries):
         try:
             async with engine.begin() as conn:
                 # Enable pgvector extension
                 await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-                await conn.run_sync(Base.metadata.create_all)
+                # Skip metadata diffing entirely when a previous boot (or
+                # init.sql) already built the schema
+                exists = await conn.scalar(text(
+                    "SELECT 1 FROM information_schema.tables "
+                    "WHERE table_name = 'conversations'"
+                ))
+                if not exists:
+                    await conn.run_sync(Base.metadata.create_all)
             logger.info("Database connection established successfully")
             return
         except Exception as e:
             if attempt < max_retries - 1:
+                # Exponential backoff with jitter so replicas restarted
+                # together don't hammer Postgres in lockstep
+                delay = min(30, (2 ** attempt) * 0.5) + random.uniform(0, 0.5)
                 logger.warning(
                     f"Database connection attempt {attempt + 1}/{max_retries} failed: {e}. "
-                    f"Retrying in {retry_delay}s..."
+                    f"Retrying in {delay:.1f}s..."
                 )
-                await asyncio.sleep(retry_delay)
+                await asyncio.sleep(delay)
             else:
                 logger.error(f"Failed to connect to database after {max_retries} attempts")
                 raise
@@ -1,30 +1,85 @@
+import logging
+import sys
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+import orjson
 import structlog
 
 from app.config import get_settings
 from app.database import init_db
 from app.api import api_router
+from app.services.storage import ensure_storage_dir
 
 settings = get_settings()
 
-# Configure structured logging
+# Configure structured logging: the filtering bound logger drops
+# below-threshold calls before the processor chain runs, loggers are
+# built once and cached, and a TTY gets readable console output instead
+# of JSON
 structlog.configure(
     processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
+        structlog.processors.add_log_level,
         structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.JSONRenderer()
+        structlog.dev.ConsoleRenderer()
+        if sys.stderr.isatty()
+        else structlog.processors.JSONRenderer()
     ],
-    wrapper_class=structlog.stdlib.BoundLogger,
+    wrapper_class=structlog.make_filtering_bound_logger(logging.INFO),
     context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
+    logger_factory=structlog.PrintLoggerFactory(),
+    cache_logger_on_first_use=True,
 )
 
-logger = structlog.get_logger()
+logger = structlog.get_logger(__name__)
+
+
+class ErrorASGIMiddleware:
+    """
+    Catch-all error handler as plain ASGI.
+
+    Exception handlers registered on the app run inside Starlette's
+    request/response scaffolding, which costs allocations on every
+    request to guard against errors that almost never happen. This
+    wrapper is a bare try/except around the downstream app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            logger.error("Unhandled exception", error=str(exc), path=scope.get("path"))
+            if response_started:
+                # The response is already on the wire; a second
+                # response.start would be a protocol error, so let the
+                # server tear the connection down
+                raise
+            await send({
+                "type": "http.response.start",
+                "status": 500,
+                "headers": [(b"content-type", b"application/json")]
+            })
+            await send({
+                "type": "http.response.body",
+                "body": orjson.dumps({"detail": "Error interno del servidor"})
+            })
 
 
 @asynccontextmanager
@@ -43,6 +98,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -55,15 +111,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost: pure ASGI, zero cost until something actually raises
+app.add_middleware(ErrorASGIMiddleware)
 
-@app.exception_handler(Exception)
-async def global_exception_handler(request: Request, exc: Exception):
-    """Global exception handler."""
-    logger.error("Unhandled exception", error=str(exc), path=request.url.path)
-    return JSONResponse(
-        status_code=500,
-        content={"detail": "Error interno del servidor"}
-    )
+# Generated design images live on disk and are served directly
+app.mount(
+    settings.image_url_prefix,
+    StaticFiles(directory=ensure_storage_dir()),
+    name="media"
+)
 
 
 @app.get("/health")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, LargeBinary
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -9,16 +9,24 @@ from app.database import Base
 
 class Conversation(Base):
     __tablename__ = "conversations"
-    
+
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(255), default="Nueva Cocina")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    
+
+    # Listing is WHERE user_id ORDER BY updated_at DESC; the composite
+    # index serves it as one range scan with no sort
+    __table_args__ = (
+        Index("ix_conv_user_updated", user_id, updated_at.desc()),
+    )
+
     # Relationships
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan", order_by="Message.created_at")
+    # Ordering happens at the query site; a relationship-level order_by
+    # would force an ORDER BY on every load, needed or not
+    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     design_iterations = relationship("DesignIteration", back_populates="conversation", cascade="all, delete-orphan")
 
 
@@ -30,7 +38,12 @@ class Message(Base):
     role = Column(String(20), nullable=False)  # user, assistant, system
     content = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
+
+    # Serves the per-conversation history fetch and its created_at order
+    __table_args__ = (
+        Index("ix_messages_conv_created", conversation_id, created_at),
+    )
+
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
     artifacts = relationship("Artifact", back_populates="message", cascade="all, delete-orphan")
@@ -45,8 +58,7 @@ class Artifact(Base):
     title = Column(String(255))
     content = Column(Text)
     image_url = Column(Text)
-    image_data = Column(LargeBinary)
-    artifact_metadata = Column(JSONB, default={})
+    artifact_metadata = Column(JSONB, server_default=text("'{}'::jsonb"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
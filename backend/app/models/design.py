@@ -1,8 +1,8 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, LargeBinary
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, Integer, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 import uuid
 
 from app.database import Base
@@ -15,12 +15,17 @@ class DesignIteration(Base):
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
     parent_iteration_id = Column(UUID(as_uuid=True), ForeignKey("design_iterations.id"), nullable=True)
     prompt_used = Column(Text, nullable=False)
-    image_data = Column(LargeBinary)
     image_url = Column(Text)
-    parameters = Column(JSONB, default={})
+    parameters = Column(JSONB, server_default=text("'{}'::jsonb"))
     version = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
+
+    # get_latest_design and the max(version) subquery both walk
+    # (conversation_id, version DESC)
+    __table_args__ = (
+        Index("ix_design_conv_ver", conversation_id, version.desc()),
+    )
+
     # Relationships
     conversation = relationship("Conversation", back_populates="design_iterations")
     parent = relationship("DesignIteration", remote_side=[id], backref="children")
@@ -31,9 +36,9 @@ class UserPreferences(Base):
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
-    preferred_styles = Column(JSONB, default=[])
-    preferred_materials = Column(JSONB, default=[])
-    budget_range = Column(JSONB, default={})
+    preferred_styles = Column(JSONB, server_default=text("'[]'::jsonb"))
+    preferred_materials = Column(JSONB, server_default=text("'[]'::jsonb"))
+    budget_range = Column(JSONB, server_default=text("'{}'::jsonb"))
     notes = Column(Text)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -47,9 +52,23 @@ class MemoryEmbedding(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(768))
+    # Half-precision storage: half the on-disk and index footprint of
+    # fp32 with negligible recall loss at this dimensionality
+    embedding = Column(HALFVEC(768))
     memory_type = Column(String(50), default="preference")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
+
+    # Graph-based ANN over cosine distance (<=>); without it every
+    # similarity lookup is a full-table scan
+    __table_args__ = (
+        Index(
+            "ix_memory_embedding_hnsw",
+            embedding,
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "halfvec_cosine_ops"},
+            postgresql_with={"m": 16, "ef_construction": 64}
+        ),
+    )
+
     # Relationships
     user = relationship("User", back_populates="memory_embeddings")
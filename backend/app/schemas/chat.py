@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Any, Literal
 from uuid import UUID
 
@@ -16,11 +16,15 @@ class ChatRequest(BaseModel):
 
 
 class ArtifactData(BaseModel):
+    # Allocated per artifact on every chat turn; immutable and closed to
+    # stray keys keeps instances lean
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     type: Literal["image", "specs", "cost_estimate", "floor_plan"]
     title: str
     content: Optional[str] = None
     image_data: Optional[str] = None  # base64 encoded
-    metadata: dict = {}
+    metadata: dict = Field(default_factory=dict)
 
 
 class ChatResponse(BaseModel):
@@ -32,6 +36,8 @@ class ChatResponse(BaseModel):
 
 
 class StreamChunk(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     type: Literal["text", "artifact_start", "artifact_data", "artifact_end", "done", "error"]
     content: Optional[str] = None
     artifact: Optional[ArtifactData] = None
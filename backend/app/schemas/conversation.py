@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Literal
 from uuid import UUID
 from datetime import datetime
 
 
 class ArtifactCreate(BaseModel):
-    artifact_type: str = Field(..., pattern="^(image|specs|cost_estimate|floor_plan)$")
+    artifact_type: Literal["image", "specs", "cost_estimate", "floor_plan"]
     title: Optional[str] = None
     content: Optional[str] = None
     image_url: Optional[str] = None
@@ -18,7 +18,9 @@ class ArtifactResponse(BaseModel):
     title: Optional[str]
     content: Optional[str]
     image_url: Optional[str]
-    metadata: dict
+    # The ORM attribute avoids SQLAlchemy's reserved `metadata` name;
+    # the API keeps the short key
+    metadata: dict = Field(default_factory=dict, validation_alias="artifact_metadata")
     created_at: datetime
     
     class Config:
@@ -26,7 +28,7 @@ class ArtifactResponse(BaseModel):
 
 
 class MessageCreate(BaseModel):
-    role: str = Field(..., pattern="^(user|assistant|system)$")
+    role: Literal["user", "assistant", "system"]
     content: str
 
 
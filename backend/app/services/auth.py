@@ -1,8 +1,12 @@
+import asyncio
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from uuid import UUID
 
-from jose import jwt, JWTError
+from cachetools import TTLCache
+import jwt
+from jwt import InvalidTokenError
 from passlib.context import CryptContext
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,35 +18,47 @@ from app.schemas.user import UserCreate, Token
 settings = get_settings()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# JWT parameters never change after startup; bound once so token minting
+# and verification skip the pydantic attribute lookups
+_JWT_SECRET = settings.jwt_secret
+_JWT_ALG = settings.jwt_algorithm
+_ACCESS_TTL = timedelta(minutes=settings.access_token_expire_minutes)
+_REFRESH_TTL = timedelta(days=settings.refresh_token_expire_days)
+
+# Memo of already-verified token payloads so every request doesn't repeat
+# the HMAC verification; entries age out after a minute and expired
+# tokens are re-checked against exp on every hit
+_jwt_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
 
 class AuthService:
     @staticmethod
-    def verify_password(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
-    
+    async def verify_password(plain_password: str, hashed_password: str) -> bool:
+        # bcrypt costs ~100ms per call; run it off the event loop so
+        # login traffic doesn't stall every other coroutine
+        return await asyncio.to_thread(pwd_context.verify, plain_password, hashed_password)
+
     @staticmethod
-    def hash_password(password: str) -> str:
-        return pwd_context.hash(password)
+    async def hash_password(password: str) -> str:
+        return await asyncio.to_thread(pwd_context.hash, password)
     
     @staticmethod
     def create_access_token(user_id: UUID) -> str:
-        expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
         payload = {
             "sub": str(user_id),
-            "exp": expire,
+            "exp": datetime.utcnow() + _ACCESS_TTL,
             "type": "access"
         }
-        return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+        return jwt.encode(payload, _JWT_SECRET, algorithm=_JWT_ALG)
     
     @staticmethod
     def create_refresh_token(user_id: UUID) -> str:
-        expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
         payload = {
             "sub": str(user_id),
-            "exp": expire,
+            "exp": datetime.utcnow() + _REFRESH_TTL,
             "type": "refresh"
         }
-        return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+        return jwt.encode(payload, _JWT_SECRET, algorithm=_JWT_ALG)
     
     @staticmethod
     def create_tokens(user_id: UUID) -> Token:
@@ -53,11 +69,18 @@ class AuthService:
     
     @staticmethod
     def decode_token(token: str) -> Optional[dict]:
+        payload = _jwt_cache.get(token)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                return payload
+            del _jwt_cache[token]
+            return None
         try:
-            payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-            return payload
-        except JWTError:
+            payload = jwt.decode(token, _JWT_SECRET, algorithms=[_JWT_ALG])
+        except InvalidTokenError:
             return None
+        _jwt_cache[token] = payload
+        return payload
     
     @staticmethod
     async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
@@ -73,7 +96,7 @@ class AuthService:
     async def create_user(db: AsyncSession, user_data: UserCreate) -> User:
         user = User(
             email=user_data.email,
-            hashed_password=AuthService.hash_password(user_data.password),
+            hashed_password=await AuthService.hash_password(user_data.password),
             full_name=user_data.full_name
         )
         db.add(user)
@@ -86,6 +109,6 @@ class AuthService:
         user = await AuthService.get_user_by_email(db, email)
         if not user:
             return None
-        if not AuthService.verify_password(password, user.hashed_password):
+        if not await AuthService.verify_password(password, user.hashed_password):
             return None
         return user
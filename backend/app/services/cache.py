@@ -0,0 +1,60 @@
+"""
+Redis-backed exact-match cache for expensive Gemini calls.
+
+Keys are derived from a canonical JSON dump of the call parameters, so
+identical analysis or generation requests across users and processes are
+served from Redis instead of paying another model round-trip. All
+operations fail open: if Redis is unavailable the caller simply proceeds
+with the real call.
+"""
+import hashlib
+from typing import Any, Optional
+
+import orjson
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Default expiry for cached model results
+CACHE_TTL_SECONDS = 86400
+
+_client: Optional[redis.Redis] = None
+
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.from_url(settings.redis_url, decode_responses=False)
+    return _client
+
+
+def cache_key(namespace: str, payload: Any) -> str:
+    """Build a cache key from a namespace and canonicalized parameters."""
+    digest = hashlib.sha256(
+        orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    ).hexdigest()
+    return f"kmcache:{namespace}:{digest}"
+
+
+async def get_cached(key: str) -> Optional[Any]:
+    """Fetch and decode a cached value, or None on miss/error."""
+    try:
+        raw = await _get_client().get(key)
+    except Exception:
+        return None
+    if raw is None:
+        return None
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return None
+
+
+async def set_cached(key: str, value: Any, ttl: int = CACHE_TTL_SECONDS) -> None:
+    """Store a value with expiry; errors are swallowed (best-effort)."""
+    try:
+        await _get_client().set(key, orjson.dumps(value), ex=ttl)
+    except Exception:
+        pass
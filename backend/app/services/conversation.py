@@ -1,9 +1,9 @@
 from typing import List, Optional
 from uuid import UUID
 
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, insert, update, delete, func, desc
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import joinedload
 
 from app.models.conversation import Conversation, Message, Artifact
 from app.models.design import DesignIteration
@@ -32,31 +32,58 @@ class ConversationService:
         conversation_id: UUID, 
         user_id: UUID
     ) -> Optional[Conversation]:
+        # One joined round trip instead of three selectin queries; the
+        # artifact fanout per message is small, so row multiplication
+        # stays cheap
         result = await db.execute(
             select(Conversation)
-            .options(selectinload(Conversation.messages).selectinload(Message.artifacts))
+            .options(joinedload(Conversation.messages).joinedload(Message.artifacts))
             .where(
                 Conversation.id == conversation_id,
                 Conversation.user_id == user_id
             )
         )
-        return result.scalar_one_or_none()
+        conversation = result.unique().scalar_one_or_none()
+        if conversation is not None:
+            # Chronological order for the chat view; N is small, so an
+            # in-place sort beats pushing ORDER BY into the joined load
+            conversation.messages.sort(key=lambda message: message.created_at)
+        return conversation
     
     @staticmethod
     async def get_user_conversations(
-        db: AsyncSession, 
+        db: AsyncSession,
         user_id: UUID,
         limit: int = 50,
         offset: int = 0
-    ) -> List[Conversation]:
+    ) -> List[tuple]:
+        """
+        List conversations as (conversation, message_count, last_message)
+        rows. Both extras are computed in SQL so listing never loads the
+        messages collection per conversation.
+        """
+        last_message = (
+            select(Message.content)
+            .where(Message.conversation_id == Conversation.id)
+            .order_by(desc(Message.created_at))
+            .limit(1)
+            .correlate(Conversation)
+            .scalar_subquery()
+        )
         result = await db.execute(
-            select(Conversation)
+            select(
+                Conversation,
+                func.count(Message.id).label("message_count"),
+                last_message.label("last_message")
+            )
+            .outerjoin(Message, Message.conversation_id == Conversation.id)
             .where(Conversation.user_id == user_id)
+            .group_by(Conversation.id)
             .order_by(desc(Conversation.updated_at))
             .limit(limit)
             .offset(offset)
         )
-        return result.scalars().all()
+        return result.all()
     
     @staticmethod
     async def add_message(
@@ -71,14 +98,15 @@ class ConversationService:
             content=content
         )
         db.add(message)
-        
-        # Update conversation timestamp
-        result = await db.execute(
-            select(Conversation).where(Conversation.id == conversation_id)
+
+        # Touch the conversation timestamp with a single UPDATE instead
+        # of fetching the row just to mutate it
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(updated_at=func.now())
         )
-        conversation = result.scalar_one()
-        conversation.updated_at = func.now()
-        
+
         await db.commit()
         await db.refresh(message)
         return message
@@ -91,7 +119,6 @@ class ConversationService:
         title: str = None,
         content: str = None,
         image_url: str = None,
-        image_data: bytes = None,
         metadata: dict = None
     ) -> Artifact:
         artifact = Artifact(
@@ -100,43 +127,69 @@ class ConversationService:
             title=title,
             content=content,
             image_url=image_url,
-            image_data=image_data,
-            metadata=metadata or {}
+            artifact_metadata=metadata or {}
         )
         db.add(artifact)
         await db.commit()
         await db.refresh(artifact)
         return artifact
     
+    @staticmethod
+    async def add_artifacts_bulk(
+        db: AsyncSession,
+        message_id: UUID,
+        artifacts: List[dict]
+    ) -> None:
+        """
+        Insert all artifacts for a message in a single executemany
+        statement instead of one INSERT + commit per artifact.
+        """
+        if not artifacts:
+            return
+        rows = [
+            {
+                "message_id": message_id,
+                "artifact_type": artifact["type"],
+                "title": artifact.get("title"),
+                "content": artifact.get("content"),
+                "image_url": artifact.get("image_url"),
+                "artifact_metadata": artifact.get("metadata") or {}
+            }
+            for artifact in artifacts
+        ]
+        await db.execute(insert(Artifact), rows)
+        await db.commit()
+
     @staticmethod
     async def save_design_iteration(
         db: AsyncSession,
         conversation_id: UUID,
         prompt: str,
-        image_data: bytes = None,
         image_url: str = None,
         parameters: dict = None,
         parent_id: UUID = None
     ) -> DesignIteration:
-        # Get current version number
-        result = await db.execute(
-            select(func.max(DesignIteration.version))
+        # Compute the next version inside the INSERT itself: one round
+        # trip, and no window for two writers to read the same max
+        next_version = (
+            select(func.coalesce(func.max(DesignIteration.version), 0) + 1)
             .where(DesignIteration.conversation_id == conversation_id)
+            .scalar_subquery()
         )
-        max_version = result.scalar() or 0
-        
-        iteration = DesignIteration(
-            conversation_id=conversation_id,
-            parent_iteration_id=parent_id,
-            prompt_used=prompt,
-            image_data=image_data,
-            image_url=image_url,
-            parameters=parameters or {},
-            version=max_version + 1
+        result = await db.execute(
+            insert(DesignIteration)
+            .values(
+                conversation_id=conversation_id,
+                parent_iteration_id=parent_id,
+                prompt_used=prompt,
+                image_url=image_url,
+                parameters=parameters or {},
+                version=next_version
+            )
+            .returning(DesignIteration)
         )
-        db.add(iteration)
+        iteration = result.scalar_one()
         await db.commit()
-        await db.refresh(iteration)
         return iteration
     
     @staticmethod
@@ -159,29 +212,28 @@ class ConversationService:
         title: str
     ) -> Conversation:
         result = await db.execute(
-            select(Conversation).where(Conversation.id == conversation_id)
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(title=title)
+            .returning(Conversation)
         )
         conversation = result.scalar_one()
-        conversation.title = title
         await db.commit()
-        await db.refresh(conversation)
         return conversation
-    
+
     @staticmethod
     async def delete_conversation(
         db: AsyncSession,
         conversation_id: UUID,
         user_id: UUID
     ) -> bool:
+        # Child rows go with the conversation via ON DELETE CASCADE, so
+        # one DELETE replaces the fetch-then-delete round trip
         result = await db.execute(
-            select(Conversation).where(
+            delete(Conversation).where(
                 Conversation.id == conversation_id,
                 Conversation.user_id == user_id
             )
         )
-        conversation = result.scalar_one_or_none()
-        if conversation:
-            await db.delete(conversation)
-            await db.commit()
-            return True
-        return False
+        await db.commit()
+        return result.rowcount > 0
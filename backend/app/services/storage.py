@@ -0,0 +1,31 @@
+import asyncio
+import os
+import uuid
+
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def ensure_storage_dir() -> str:
+    """Create the image storage directory if needed and return its path."""
+    os.makedirs(settings.image_storage_dir, exist_ok=True)
+    return settings.image_storage_dir
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as fh:
+        fh.write(data)
+
+
+async def save_image(data: bytes, suffix: str = ".png") -> str:
+    """
+    Persist image bytes to the local store and return their public URL.
+
+    The write runs in a worker thread so multi-megabyte images never
+    block the event loop.
+    """
+    name = f"{uuid.uuid4().hex}{suffix}"
+    path = os.path.join(settings.image_storage_dir, name)
+    await asyncio.to_thread(_write_file, path, data)
+    return f"{settings.image_url_prefix}/{name}"
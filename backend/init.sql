@@ -39,7 +39,6 @@ CREATE TABLE IF NOT EXISTS artifacts (
     title VARCHAR(255),
     content TEXT,
     image_url TEXT,
-    image_data BYTEA,
     artifact_metadata JSONB DEFAULT '{}',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -61,7 +60,6 @@ CREATE TABLE IF NOT EXISTS design_iterations (
     conversation_id UUID NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
     parent_iteration_id UUID REFERENCES design_iterations(id),
     prompt_used TEXT NOT NULL,
-    image_data BYTEA,
     image_url TEXT,
     parameters JSONB DEFAULT '{}',
     version INTEGER DEFAULT 1,
@@ -73,7 +71,7 @@ CREATE TABLE IF NOT EXISTS memory_embeddings (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
     content TEXT NOT NULL,
-    embedding vector(768),
+    embedding halfvec(768),
     memory_type VARCHAR(50) DEFAULT 'preference',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -86,5 +84,5 @@ CREATE INDEX IF NOT EXISTS idx_design_iterations_conversation_id ON design_itera
 CREATE INDEX IF NOT EXISTS idx_memory_embeddings_user_id ON memory_embeddings(user_id);
 
 -- Vector similarity index
-CREATE INDEX IF NOT EXISTS idx_memory_embeddings_vector ON memory_embeddings 
-USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX IF NOT EXISTS idx_memory_embeddings_vector ON memory_embeddings
+USING hnsw (embedding halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);